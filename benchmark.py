@@ -0,0 +1,345 @@
+import argparse  # Import argparse to parse command line options
+import copy  # Import copy to derive the benchmark configuration without modifying the original one
+import json  # Import json to write the machine-readable benchmark report
+import os  # Import os to handle file operations
+import platform  # Import platform to record the Python version in the report
+import subprocess  # Import subprocess to record the git commit in the report and to start fresh interpreters
+import sys  # Import sys to start fresh interpreters with the current Python executable
+import tempfile  # Import tempfile to run the benchmark in a scratch directory
+import time  # Import time to measure the evaluation time of the likelihoods
+import bilby  # Import bilby to record its version in the report
+import numpy as np  # Import numpy for numerical operations
+import pandas as pd  # Import pandas for data manipulation and analysis
+from parameter_estimation import (  # Import the building blocks of the parameter estimation
+    LIKELIHOOD_MODES,
+    create_likelihood,
+    create_priors,
+    create_waveform_generator,
+    find_reference_frequency,
+)
+from storage import load_biases, load_event_summary, load_population  # Import the loaders of the storage layer
+from detector_cache import interferometers_from_config  # Import the cached detector and noise setup
+from generate_population import generate_population  # Import function to generate population
+from parameter_estimation import run_parameter_estimation  # Import function to run parameter estimation
+from bias_calculation import calculate_bias  # Import function to calculate bias
+from instrumentation import load_metrics, peak_rss_megabytes  # Import the memory high-water mark measurement and the event metrics
+from cli import SUBCOMMAND_MODULES  # Import the modules imported by each subcommand of the command line interface
+from main import load_config, save_config  # Import the configuration loader and saver functions
+
+# Settings of the fixed, seeded mini-population run by benchmark_pipeline
+BENCHMARK_SETTINGS = dict(
+    num_events=4,
+    npoints=50,
+    population_seed=1234,
+    noise_seed=1234,
+    waveform_approximant_injection="IMRPhenomD",
+    waveform_approximant_estimation="IMRPhenomD",
+    num_workers=1,
+    cores_per_sampler=1,
+)
+
+def benchmark_likelihoods(config, result_directory, num_events=5, num_evaluations=200, modes=LIKELIHOOD_MODES):
+    """
+    Compare the evaluation time and accuracy of the likelihood modes on the events of a population.
+
+    Args:
+        config (dict): Configuration dictionary of the run.
+        result_directory (str): Directory containing the population file; the report is saved there as well.
+        num_events (int): Number of events of the population to benchmark. Defaults to 5.
+        num_evaluations (int): Number of prior draws at which each likelihood is evaluated. Defaults to 200.
+        modes (tuple): Likelihood modes to compare. The "standard" mode is always included as the reference.
+
+    Returns:
+        pandas.DataFrame: One row per event and likelihood mode with the mean time per evaluation, the speed-up with
+                          respect to the standard likelihood and the mean and maximum absolute difference of the
+                          log-likelihood ratio to the standard likelihood at the same draws.
+    """
+    # Load the population parameters from the population file
+    population_parameters = load_population(result_directory, config)
+
+    modes = ["standard"] + [mode for mode in modes if mode != "standard"]
+    rows = []
+
+    for i, params in enumerate(population_parameters[:num_events]):
+        params["geocent_time"] = config["geocent_time"]
+        priors = create_priors(params, config)
+        priors["geocent_time"] = config["geocent_time"]
+
+        frequency, _ = find_reference_frequency(params, config)
+        if frequency is None:
+            print(f"Skipping event {i}: no valid reference frequency found.")
+            continue
+
+        # Inject the event once so that all likelihood modes see the same data
+        ifos = interferometers_from_config(config)
+        ifos.inject_signal(
+            waveform_generator=create_waveform_generator(config, config['waveform_approximant_injection'], frequency),
+            parameters=params,
+        )
+
+        # Evaluate every likelihood at the same prior draws
+        samples = [priors.sample() for _ in range(num_evaluations)]
+        reference_values = None
+        reference_time = None
+
+        for mode in modes:
+            likelihood = create_likelihood(
+                config, ifos, config['waveform_approximant_estimation'], frequency,
+                fiducial_parameters=params, priors=priors, mode=mode,
+            )
+
+            values = np.empty(num_evaluations)
+            start = time.perf_counter()
+            for j, sample in enumerate(samples):
+                # Pass the sample explicitly, as setting likelihood.parameters is deprecated and warns on each call
+                values[j] = likelihood.log_likelihood_ratio(parameters=sample)
+            time_per_evaluation = (time.perf_counter() - start) / num_evaluations
+
+            if mode == "standard":
+                reference_values = values
+                reference_time = time_per_evaluation
+
+            difference = np.abs(values - reference_values)
+            rows.append({
+                "event": i,
+                "likelihood": mode,
+                "time_per_evaluation": time_per_evaluation,
+                "speed_up": reference_time / time_per_evaluation,
+                "mean_abs_log_likelihood_difference": difference.mean(),
+                "max_abs_log_likelihood_difference": difference.max(),
+            })
+
+    report = pd.DataFrame(rows)
+    print(report.groupby("likelihood")[["time_per_evaluation", "speed_up", "mean_abs_log_likelihood_difference"]].mean())
+
+    report.to_csv(f"{result_directory}/likelihood_benchmark.csv", index=False)
+    print(f"Likelihood benchmark saved to {result_directory}/likelihood_benchmark.csv")
+    return report
+
+def compare_biases(reference_bias_file, bias_file):
+    """
+    Compare the biases of two runs on the same population, e.g. with the standard and an accelerated likelihood.
+
+    Args:
+        reference_bias_file (str): Path to the bias CSV file of the reference run.
+        bias_file (str): Path to the bias CSV file of the compared run.
+
+    Returns:
+        pandas.DataFrame: One row per parameter with the mean bias of both runs, the change of the mean bias and the
+                          root-mean-square difference of the per-event biases.
+    """
+    reference = load_biases(reference_bias_file)
+    compared = load_biases(bias_file)
+
+    # Only compare events and parameters present in both runs
+    events = reference.index.intersection(compared.index)
+    parameters = reference.columns.intersection(compared.columns)
+    reference = reference.loc[events, parameters]
+    compared = compared.loc[events, parameters]
+
+    comparison = pd.DataFrame({
+        "reference_mean_bias": reference.mean(),
+        "mean_bias": compared.mean(),
+        "mean_bias_change": compared.mean() - reference.mean(),
+        "rms_bias_difference": np.sqrt(((compared - reference) ** 2).mean()),
+    })
+    print(comparison)
+    return comparison
+
+def git_commit():
+    """
+    Get the git commit of the working tree the benchmark runs on.
+
+    Returns:
+        str or None: The commit hash, or None if it cannot be determined.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def benchmark_peak_rss(result_directory):
+    """
+    Get the peak resident set size of a benchmark run.
+
+    Args:
+        result_directory (str): Directory where the results of the run are stored.
+
+    Returns:
+        float: The largest of the peak of the current process and the peaks recorded in the metrics of the events, in
+               megabytes. Events run by worker processes are only covered by the latter.
+    """
+    peaks = [peak_rss_megabytes()]
+    for metrics in load_metrics(result_directory).values():
+        peaks.extend(metrics.get(name) or 0.0 for name in ("peak_rss_megabytes", "children_peak_rss_megabytes"))
+    return max(peaks)
+
+def sampler_statistics(result_directory, event_ids):
+    """
+    Collect the sampler statistics of the results of a run.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+        event_ids (list): Events to collect the statistics of.
+
+    Returns:
+        dict: Per event the sampling time in seconds, the number of likelihood evaluations, the likelihood
+              evaluations per second and the sampler efficiency (nested samples per likelihood evaluation).
+    """
+    statistics = {}
+    for i in event_ids:
+        # The summaries are kept whatever the retention policy does with the full results
+        summary = load_event_summary(result_directory, i)
+        sampling_time = summary["sampling_time"]
+        evaluations = summary["likelihood_evaluations"]
+        statistics[str(i)] = {
+            "sampling_time": sampling_time,
+            "likelihood_evaluations": evaluations,
+            "likelihood_evaluations_per_second": evaluations / sampling_time,
+            "sampler_efficiency": summary["num_nested_samples"] / evaluations,
+        }
+    return statistics
+
+def benchmark_cold_start(subcommands=None, repeats=3):
+    """
+    Measure the cold-start time of the subcommands of the command line interface.
+
+    Args:
+        subcommands (list, optional): Subcommands to measure. Defaults to all subcommands of cli.SUBCOMMAND_MODULES.
+        repeats (int): Number of fresh interpreters started per subcommand. Defaults to 3.
+
+    Returns:
+        dict: The shortest wall time in seconds, over the repeats, from starting a fresh interpreter until the
+              command line interface and the modules of each subcommand are imported, keyed by subcommand. The key
+              "python" holds the start-up time of a bare interpreter for comparison.
+
+    The shortest time is reported, as it is the least disturbed by other processes; the first start of a repeat may
+    still be slower if the files of the modules are not in the page cache yet.
+    """
+    commands = {"python": "pass"}
+    for name in subcommands or SUBCOMMAND_MODULES:
+        commands[name] = f"import cli; cli.import_subcommand({name!r})"
+
+    times = {}
+    for name, command in commands.items():
+        durations = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", command], check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            durations.append(time.perf_counter() - start)
+        times[name] = min(durations)
+        print(f"{name}: {times[name]:.2f} s")
+    return times
+
+def benchmark_pipeline(config, output_file, result_directory=None, **settings):
+    """
+    Run a fixed, seeded mini-population through the pipeline and write a machine-readable performance report.
+
+    Args:
+        config (dict): Configuration dictionary the benchmark configuration is derived from.
+        output_file (str): Path of the JSON report.
+        result_directory (str, optional): Directory for the results of the benchmark run; it must be empty or not
+                                          exist yet. Defaults to a new temporary directory.
+        **settings: Settings overriding BENCHMARK_SETTINGS, e.g. npoints or the waveform approximants.
+
+    Returns:
+        dict: The report, with the wall time of each stage, the peak resident set size, the cold-start time of each
+              subcommand of the command line interface, the sampler statistics of each event and their means, the
+              full benchmark configuration and the git commit and package versions.
+
+    Raises:
+        ValueError: If the results directory is not empty, as the events of an earlier run would be skipped.
+
+    The benchmark configuration is saved to config.yaml in the results directory, so that the likelihood benchmark
+    and cli.py analyse the results with the same settings. The report is written with sorted keys so that reports of different commits can be compared with diff.
+    """
+    benchmark_config = copy.deepcopy(config)
+    benchmark_config.update(BENCHMARK_SETTINGS)
+    benchmark_config.update(settings)
+    result_directory = result_directory or tempfile.mkdtemp(prefix="benchmark_")
+    if os.path.isdir(result_directory) and os.listdir(result_directory):
+        raise ValueError(f"The benchmark results directory {result_directory} is not empty; the finished events of "
+                         f"its run manifest would be skipped. Choose a new or empty directory.")
+    os.makedirs(result_directory, exist_ok=True)
+    save_config(benchmark_config, result_directory)
+
+    # Run the stages of the pipeline one after another and time each of them
+    stage_times = {}
+    start = time.perf_counter()
+    generate_population(config=benchmark_config, result_directory=result_directory)
+    stage_times["generate_population"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    summaries = run_parameter_estimation(config=benchmark_config, result_directory=result_directory)
+    stage_times["parameter_estimation"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    calculate_bias(config=benchmark_config, result_directory=result_directory)
+    stage_times["bias_calculation"] = time.perf_counter() - start
+
+    events = sampler_statistics(result_directory, [summary["event"] for summary in summaries if summary["success"]])
+    means = {
+        name: float(np.mean([event[name] for event in events.values()])) if events else None
+        for name in ("sampling_time", "likelihood_evaluations_per_second", "sampler_efficiency")
+    }
+
+    report = {
+        "commit": git_commit(),
+        "versions": {"python": platform.python_version(), "bilby": bilby.__version__, "numpy": np.__version__},
+        "settings": benchmark_config,
+        "stage_wall_time": stage_times,
+        "total_wall_time": sum(stage_times.values()),
+        "peak_rss_megabytes": benchmark_peak_rss(result_directory),
+        "cold_start": benchmark_cold_start(),
+        "failed_events": sum(not summary["success"] for summary in summaries),
+        "events": events,
+        "mean": means,
+    }
+
+    with open(output_file, 'w') as f:
+        json.dump(report, f, indent=4, sort_keys=True)
+    print(f"Pipeline benchmark saved to {output_file}")
+    return report
+
+if __name__ == "__main__":
+    # Parse the command line options
+    parser = argparse.ArgumentParser(description="Benchmark the parameter estimation pipeline.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    likelihood_parser = subparsers.add_parser("likelihood", help="compare the speed and accuracy of the likelihoods")
+    likelihood_parser.add_argument("result_directory", help="results directory containing the population")
+    likelihood_parser.add_argument("--events", type=int, default=5, help="number of events to benchmark")
+    likelihood_parser.add_argument("--evaluations", type=int, default=200, help="likelihood evaluations per mode")
+
+    pipeline_parser = subparsers.add_parser("pipeline", help="time a seeded mini-population through the pipeline")
+    pipeline_parser.add_argument("output_file", help="JSON file to write the report to")
+    pipeline_parser.add_argument("--config", default="config.yaml", help="configuration the benchmark is derived from")
+    pipeline_parser.add_argument("--result-directory", default=None, help="directory for the benchmark results")
+    pipeline_parser.add_argument("--events", type=int, default=BENCHMARK_SETTINGS["num_events"],
+                                 help="number of events of the mini-population")
+    pipeline_parser.add_argument("--npoints", type=int, default=BENCHMARK_SETTINGS["npoints"],
+                                 help="number of live points of the sampler")
+
+    bias_parser = subparsers.add_parser("bias", help="compare the biases of two runs on the same population")
+    bias_parser.add_argument("reference_bias_file", help="bias file of the run with the standard likelihood")
+    bias_parser.add_argument("bias_file", help="bias file of the run with the compared likelihood")
+
+    cold_start_parser = subparsers.add_parser("cold-start", help="time the start-up of the command line subcommands")
+    cold_start_parser.add_argument("subcommands", nargs="*", help="subcommands to time (defaults to all)")
+    cold_start_parser.add_argument("--repeats", type=int, default=3, help="fresh interpreters per subcommand")
+
+    args = parser.parse_args()
+
+    if args.command == "likelihood":
+        config = load_config(f"{args.result_directory}/config.yaml")
+        benchmark_likelihoods(config, args.result_directory, num_events=args.events, num_evaluations=args.evaluations)
+    elif args.command == "pipeline":
+        benchmark_pipeline(load_config(args.config), args.output_file, result_directory=args.result_directory,
+                           num_events=args.events, npoints=args.npoints)
+    elif args.command == "bias":
+        compare_biases(args.reference_bias_file, args.bias_file)
+    elif args.command == "cold-start":
+        benchmark_cold_start(args.subcommands, repeats=args.repeats)
@@ -1,7 +1,168 @@
-import json  # Import json to handle JSON file operations
 import pandas as pd  # Import pandas for data manipulation and analysis
+import numpy as np  # Import numpy for numerical operations
 import os  # Import os to handle file operations
-import bilby  # Import bilby for gravitational wave data analysis
+from concurrent.futures import ProcessPoolExecutor  # Import process pool to load results in parallel
+from storage import load_biases, load_population, load_posterior, save_biases  # Import the storage layer
+import bias_store  # Import the incremental bias store
+from layout import (  # Import the layout of the results directories
+    approximant_directory,
+    comparison_approximants,
+    event_label,
+    sweep_directory,
+    sweep_frequencies,
+)
+
+# Name of the table of biases per event and reference frequency of a reference frequency sweep
+SWEEP_BIAS_FILE = "bias_vs_reference_frequency.csv"
+
+# Name of the table of biases per event and estimation approximant of an approximant comparison
+COMPARISON_BIAS_FILE = "bias_vs_approximant.csv"
+
+def load_event_posterior(result_directory, index):
+    """
+    Load the posterior samples of a single event.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+        index (int): Index of the event in the population.
+
+    Returns:
+        pandas.DataFrame or None: The thinned posterior saved by the storage layer, or, for results written before
+                                  it existed, the posterior of the bilby result file. None if the event has no result.
+    """
+    posterior = load_posterior(result_directory, index)
+    if posterior is not None:
+        return posterior
+
+    # Fall back to the full bilby result file, which the retention policy may have compressed
+    result_file = f"{result_directory}/{event_label(index)}_result.json"
+    for path in (result_file, f"{result_file}.gz"):
+        if os.path.exists(path):
+            import bilby  # Imported here, as only results written before the storage layer need bilby to be read
+            return bilby.result.read_in_result(path).posterior
+
+    return None
+
+def summarize_posterior(posterior, true_values, estimated_parameters, credible_level=0.9):
+    """
+    Compute the summary statistics of a posterior with respect to the true parameter values.
+
+    Args:
+        posterior (pandas.DataFrame): Posterior samples of a single event.
+        true_values (dict): True (injected) value of each parameter.
+        estimated_parameters (list): Parameters which were estimated and get the full set of statistics.
+        credible_level (float): Probability contained in the symmetric credible interval. Defaults to 0.9.
+
+    Returns:
+        dict: The bias of the posterior mean for every parameter of true_values present in the posterior (stored
+              under the parameter name), and for every estimated parameter the bias of the posterior median
+              ("<param>_median_bias") and of the maximum a posteriori sample ("<param>_map_bias"), the bounds of the
+              credible interval ("<param>_lower", "<param>_upper") and the fraction of samples below the true value
+              ("<param>_truth_percentile"), which is the input of a PP-plot.
+
+    All statistics are computed at once on the array of samples of all parameters instead of column by column.
+    """
+    summary = {}
+
+    # Bias of the posterior mean for every parameter
+    parameters = [param for param in true_values if param in posterior.columns]
+    samples = posterior[parameters].to_numpy()
+    truths = np.array([true_values[param] for param in parameters])
+    summary.update(zip(parameters, samples.mean(axis=0) - truths))
+
+    estimated = [param for param in estimated_parameters if param in parameters]
+    if not estimated:
+        return summary
+
+    columns = [parameters.index(param) for param in estimated]
+    samples = samples[:, columns]
+    truths = truths[columns]
+
+    # The maximum a posteriori sample maximizes the likelihood times the prior
+    log_posterior = posterior["log_likelihood"].to_numpy()
+    if "log_prior" in posterior.columns:
+        log_posterior = log_posterior + posterior["log_prior"].to_numpy()
+    map_sample = samples[np.argmax(log_posterior)]
+
+    tail = (1 - credible_level) / 2
+    median, lower, upper = np.quantile(samples, [0.5, tail, 1 - tail], axis=0)
+    truth_percentile = (samples < truths).mean(axis=0)
+
+    for j, param in enumerate(estimated):
+        summary[f"{param}_median_bias"] = median[j] - truths[j]
+        summary[f"{param}_map_bias"] = map_sample[j] - truths[j]
+        summary[f"{param}_lower"] = lower[j]
+        summary[f"{param}_upper"] = upper[j]
+        summary[f"{param}_truth_percentile"] = truth_percentile[j]
+
+    return summary
+
+def compute_event_bias(result_directory, index, true_values, estimated_parameters, credible_level=0.9):
+    """
+    Load the posterior of a single event once and compute its bias row.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+        index (int): Index of the event in the population.
+        true_values (dict): True (injected) value of each parameter of the event.
+        estimated_parameters (list): Parameters which were estimated.
+        credible_level (float): Probability contained in the credible interval. Defaults to 0.9.
+
+    Returns:
+        dict or None: The summary of summarize_posterior with the event id under "event_id", or None if the event
+                      has no result.
+    """
+    posterior = load_event_posterior(result_directory, index)
+    if posterior is None:
+        return None
+
+    return {"event_id": index, **summarize_posterior(posterior, true_values, estimated_parameters, credible_level)}
+
+def estimated_parameters(config):
+    """
+    List the parameters marked for estimation in the configuration.
+
+    Args:
+        config (dict): Configuration dictionary with the key "parameters".
+
+    Returns:
+        list: Names of the parameters with "estimate" set to true.
+    """
+    return [name for name, settings in config.get("parameters", {}).items() if settings.get("estimate")]
+
+def update_event_bias(config, result_directory, index, true_values):
+    """
+    Compute the bias row of a single finished event and add it to the incremental bias store.
+
+    Args:
+        config (dict): Configuration dictionary with the keys "bias_output_file" and "parameters" and the optional
+                       key "credible_level".
+        result_directory (str): Directory where the results are stored.
+        index (int): Index of the event in the population.
+        true_values (dict): True (injected) value of each parameter of the event.
+
+    Returns:
+        bool: True if the row was added, False if the event has no result or was already processed.
+
+    Called as soon as an event has finished, so that the bias trends of a campaign can be followed while it runs;
+    the population-level running mean of the bias of each estimated parameter is printed.
+    """
+    if index in bias_store.processed_events(result_directory, config):
+        return False
+
+    row = compute_event_bias(
+        result_directory, index, true_values, estimated_parameters(config), config.get("credible_level", 0.9)
+    )
+    if row is None or not bias_store.record_event_bias(result_directory, config, row):
+        return False
+
+    statistics = bias_store.load_running_statistics(result_directory)
+    trends = ", ".join(
+        f"{param}: {statistics[param]['mean']:.3g}" for param in estimated_parameters(config) if param in statistics
+    )
+    count = max(entry["count"] for entry in statistics.values())
+    print(f"Bias of event {index} recorded; running mean bias over {count} events: {trends}")
+    return True
 
 def calculate_bias(config, result_directory):
     """
@@ -12,49 +173,139 @@ def calculate_bias(config, result_directory):
                        It should have the following keys:
                        - "population_file" (str): Name of the file containing the true population parameters.
                        - "bias_output_file" (str): Name of the file to save the calculated biases.
+                       The optional keys "credible_level" (defaults to 0.9) and "num_workers" (number of processes
+                       loading results concurrently, defaults to 1) are used as well.
         result_directory (str): Directory where the results and population files are stored.
 
     Returns:
-        None. The calculated biases are saved to a CSV file specified by the 'bias_output_file' key in the config.
-
-    This function reads the true parameters from a population file, compares them with the estimated values from
-    result files, and calculates the bias for each parameter. The biases are saved to a CSV file.
-    """
-    # Load the true population parameters from the specified JSON file
-    with open(f"{result_directory}/{config['population_file']}", 'r') as f:
-        population_parameters = json.load(f)
-
-    biases = []  # List to store bias for each event
-
-    # Iterate over each set of population parameters
-    for i, params in enumerate(population_parameters):
-        # Define the path to the result file for the current event
-        result_file = f"{result_directory}/label_result.json"  # Assumes a common result file; modify if necessary
-        
-        # Check if the result file exists
-        if os.path.exists(result_file):
-            # Read in the result file using bilby's function
-            result = bilby.result.read_in_result(result_file)
-            posterior = result.posterior  # Access the posterior distribution
-
-            biases_event = {}  # Dictionary to store biases for the current event
-            
-            # Calculate bias for each parameter
-            for param in params.keys():
-                estimated_value = posterior[param].mean()  # Calculate the mean of the posterior for the parameter
-                true_value = params[param]  # Get the true value from the population parameters
-                bias = estimated_value - true_value  # Calculate the bias
-                biases_event[param] = bias  # Store the bias in the dictionary
-
-            biases.append(biases_event)  # Append the biases for the event to the list
-
-    # Convert the list of biases to a DataFrame
-    bias_df = pd.DataFrame(biases)
+        pandas.DataFrame: One row per event with a result, indexed by event id, with the columns described in
+        summarize_posterior. The table is also saved to a CSV file specified by the 'bias_output_file' key in the
+        config, and to a columnar Arrow file of the same name next to it.
+
+    This function reads the true parameters from a population file, loads the posterior of each event exactly once
+    and computes the bias and summary statistics of all parameters in one pass. Events which are already in the
+    incremental bias store (see update_event_bias) are not computed again.
+    """
+    # Load the true population parameters from the population file
+    population_parameters = load_population(result_directory, config)
+
+    estimated = estimated_parameters(config)
+    credible_level = config.get("credible_level", 0.9)
+    num_workers = config.get("num_workers", 1)
+    processed = bias_store.processed_events(result_directory, config)
+    arguments = [
+        (result_directory, i, params, estimated, credible_level)
+        for i, params in enumerate(population_parameters)
+        if i not in processed
+    ]
+
+    # Compute the bias row of every event which is not stored yet, optionally loading the results in parallel
+    if num_workers > 1 and arguments:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            rows = list(executor.map(compute_event_bias, *zip(*arguments)))
+    else:
+        rows = [compute_event_bias(*args) for args in arguments]
+
+    # Add the rows of the events with a result to the bias store
+    for row in rows:
+        if row is not None:
+            bias_store.record_event_bias(result_directory, config, row)
+
+    # Load the complete table of the stored rows, indexed by event id
+    store_path = bias_store.bias_store_path(result_directory, config)
+    if os.path.exists(store_path):
+        bias_df = load_biases(store_path).sort_index()
+    else:
+        bias_df = pd.DataFrame({"event_id": []}).set_index("event_id")
     print(bias_df)  # Print the DataFrame for inspection
 
-    # Save the DataFrame to a CSV file
-    bias_df.to_csv(f"{result_directory}/{config['bias_output_file']}", index=True)
+    # Save the DataFrame to a CSV file and a columnar Arrow file
+    save_biases(result_directory, config, bias_df)
     print(f"Bias calculation completed and saved to {result_directory}/{config['bias_output_file']}")
+    return bias_df
+
+def calculate_variant_bias(config, result_directory, directories, column, output_file):
+    """
+    Calculate the biases of runs which analysed the same injections in several variants.
+
+    Args:
+        config (dict): Configuration dictionary of the run, with the optional keys "credible_level" and
+                       "num_workers".
+        result_directory (str): Directory where the population is stored.
+        directories (dict): Mapping from the value identifying each variant (e.g. its reference frequency) to the
+                            results directory of the variant.
+        column (str): Name of the column holding the variant values.
+        output_file (str): Name of the file in the results directory to save the table to.
+
+    Returns:
+        pandas.DataFrame: One row per event and variant with a result, indexed by the variant column and event id,
+                          with the columns described in summarize_posterior. The mean bias of each variant is
+                          printed.
+    """
+    population_parameters = load_population(result_directory, config)
+    estimated = estimated_parameters(config)
+    credible_level = config.get("credible_level", 0.9)
+    num_workers = config.get("num_workers", 1)
+    runs = [(value, i) for value in directories for i in range(len(population_parameters))]
+    arguments = [
+        (directories[value], i, population_parameters[i], estimated, credible_level) for value, i in runs
+    ]
+
+    # Compute the bias row of every run, optionally loading the results in parallel
+    if num_workers > 1 and arguments:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            rows = list(executor.map(compute_event_bias, *zip(*arguments)))
+    else:
+        rows = [compute_event_bias(*args) for args in arguments]
+
+    records = [{column: value, **row} for (value, _), row in zip(runs, rows) if row is not None]
+    bias_df = pd.DataFrame(records if records else {column: [], "event_id": []})
+    bias_df = bias_df.set_index([column, "event_id"]).sort_index()
+
+    # Print the mean bias of the estimated parameters of each variant
+    print(bias_df[[name for name in estimated if name in bias_df.columns]].groupby(level=column).mean())
+
+    path = os.path.join(result_directory, output_file)
+    bias_df.to_csv(path, index=True)
+    print(f"Biases saved to {path}")
+    return bias_df
+
+def calculate_reference_frequency_bias(config, result_directory):
+    """
+    Calculate the biases of a reference frequency sweep.
+
+    Args:
+        config (dict): Configuration dictionary of the run, with the reference frequencies of the sweep (see
+                       layout.sweep_frequencies).
+        result_directory (str): Directory where the population and the results of the sweep are stored.
+
+    Returns:
+        pandas.DataFrame: The biases as returned by calculate_variant_bias, indexed by reference frequency and event
+                          id, also saved to SWEEP_BIAS_FILE in the results directory.
+    """
+    directories = {
+        frequency: sweep_directory(result_directory, frequency) for frequency in sweep_frequencies(config)
+    }
+    return calculate_variant_bias(config, result_directory, directories, "reference_frequency", SWEEP_BIAS_FILE)
+
+def calculate_approximant_bias(config, result_directory):
+    """
+    Calculate the biases of an approximant comparison.
+
+    Args:
+        config (dict): Configuration dictionary of the run, with the estimation approximants of the comparison (see
+                       layout.comparison_approximants).
+        result_directory (str): Directory where the population and the results of the comparison are stored.
+
+    Returns:
+        pandas.DataFrame: The biases as returned by calculate_variant_bias, indexed by approximant and event id, also
+                          saved to COMPARISON_BIAS_FILE in the results directory.
+    """
+    directories = {
+        approximant: approximant_directory(result_directory, approximant)
+        for approximant in comparison_approximants(config)
+    }
+    return calculate_variant_bias(config, result_directory, directories, "approximant", COMPARISON_BIAS_FILE)
 
 if __name__ == "__main__":
     # Example configuration and result directory for running the function
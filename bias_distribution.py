@@ -1,4 +1,4 @@
-import pandas as pd  # Import pandas for data manipulation and analysis
+from storage import load_biases  # Import the bias table loader of the storage layer
 import matplotlib.pyplot as plt  # Import matplotlib for plotting
 
 def plot_bias_distributions(csv_file_path, columns, bins):
@@ -6,14 +6,14 @@ def plot_bias_distributions(csv_file_path, columns, bins):
     Load bias data from a CSV file and plot the bias distributions for specified parameters in two separate subplots within the same figure.
 
     Args:
-        csv_file_path (str): Path to the CSV file containing bias data.
+        csv_file_path (str): Path to the CSV (or columnar Arrow) file containing bias data.
         columns (list): List of two column names to plot.
 
     Returns:
         None. Displays a figure with two subplots of the bias distributions for the specified parameters.
     """
-    # Load the data from the CSV file into a DataFrame
-    data = pd.read_csv(csv_file_path)
+    # Load the data from the bias file into a DataFrame
+    data = load_biases(csv_file_path)
 
     # Ensure that exactly two columns are specified
     if len(columns) != 2:
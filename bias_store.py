@@ -0,0 +1,158 @@
+import json  # Import json to handle JSON file operations
+import os  # Import os to handle file operations
+import numpy as np  # Import numpy for numerical operations
+import pandas as pd  # Import pandas for data manipulation and analysis
+
+# Name of the file holding the running statistics of the biases inside a results directory
+STATISTICS_FILE = "bias_statistics.json"
+
+def bias_store_path(result_directory, config):
+    """
+    Build the path of the CSV file to which the bias row of each event is appended.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+        config (dict): Configuration dictionary with the key "bias_output_file".
+
+    Returns:
+        str: Path of the bias CSV file.
+    """
+    return f"{result_directory}/{config['bias_output_file']}"
+
+def processed_events(result_directory, config):
+    """
+    List the events which already have a row in the bias store.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+        config (dict): Configuration dictionary with the key "bias_output_file".
+
+    Returns:
+        set: Event ids of the stored rows.
+    """
+    path = bias_store_path(result_directory, config)
+    if not os.path.exists(path):
+        return set()
+
+    return set(pd.read_csv(path, usecols=[0]).iloc[:, 0].astype(int))
+
+def append_event_bias(result_directory, config, row):
+    """
+    Append the bias row of a single event to the bias store.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+        config (dict): Configuration dictionary with the key "bias_output_file".
+        row (dict): Bias row as returned by bias_calculation.compute_event_bias, including "event_id".
+
+    Returns:
+        None. The row is appended to the CSV file, which is created with a header if it does not exist yet.
+    """
+    path = bias_store_path(result_directory, config)
+    row_df = pd.DataFrame([row])
+
+    if os.path.exists(path):
+        # Keep the column order of the existing file
+        header = pd.read_csv(path, nrows=0).columns
+        row_df.reindex(columns=header).to_csv(path, mode='a', header=False, index=False)
+    else:
+        row_df[["event_id"] + [name for name in row_df.columns if name != "event_id"]].to_csv(path, index=False)
+
+def load_running_statistics(result_directory):
+    """
+    Load the running statistics of the biases.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+
+    Returns:
+        dict: Mapping from column name to a dictionary with the number of events "count", the running "mean" and the
+              sum of squared deviations "m2". Empty if no event has been processed yet.
+    """
+    path = os.path.join(result_directory, STATISTICS_FILE)
+    if not os.path.exists(path):
+        return {}
+
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def update_running_statistics(result_directory, row):
+    """
+    Add the bias row of a single event to the running statistics.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+        row (dict): Bias row of the event.
+
+    Returns:
+        dict: The updated running statistics.
+
+    The mean and variance are updated with Welford's algorithm, so that the population-level aggregates never
+    require reading the rows of previous events again.
+    """
+    statistics = load_running_statistics(result_directory)
+
+    for name, value in row.items():
+        if name == "event_id" or value is None or not np.isfinite(value):
+            continue
+        entry = statistics.setdefault(name, {"count": 0, "mean": 0.0, "m2": 0.0})
+        entry["count"] += 1
+        delta = value - entry["mean"]
+        entry["mean"] += delta / entry["count"]
+        entry["m2"] += delta * (value - entry["mean"])
+
+    # Write to a temporary file first, so that a crash never leaves truncated statistics behind
+    path = os.path.join(result_directory, STATISTICS_FILE)
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(statistics, f, indent=4)
+    os.replace(f"{path}.tmp", path)
+
+    return statistics
+
+def summarize_running_statistics(statistics):
+    """
+    Convert running statistics to a table.
+
+    Args:
+        statistics (dict): Running statistics as returned by load_running_statistics.
+
+    Returns:
+        pandas.DataFrame: One row per column of the bias table with the number of events, the mean, the standard
+                          deviation and the standard error of the mean.
+    """
+    rows = {}
+    for name, entry in statistics.items():
+        count = entry["count"]
+        std = np.sqrt(entry["m2"] / (count - 1)) if count > 1 else np.nan
+        rows[name] = {"count": count, "mean": entry["mean"], "std": std, "sem": std / np.sqrt(count)}
+
+    return pd.DataFrame.from_dict(rows, orient="index", columns=["count", "mean", "std", "sem"])
+
+def record_event_bias(result_directory, config, row):
+    """
+    Add the bias row of a finished event to the bias store and the running statistics, unless it is already stored.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+        config (dict): Configuration dictionary with the key "bias_output_file".
+        row (dict): Bias row as returned by bias_calculation.compute_event_bias.
+
+    Returns:
+        bool: True if the row was added, False if the event was already processed.
+    """
+    if row["event_id"] in processed_events(result_directory, config):
+        return False
+
+    append_event_bias(result_directory, config, row)
+    update_running_statistics(result_directory, row)
+    return True
+
+if __name__ == "__main__":
+    import argparse  # Import argparse to parse command line options
+
+    # Print the running statistics of a (possibly still running) campaign
+    parser = argparse.ArgumentParser(description="Show the running bias statistics of a results directory.")
+    parser.add_argument("result_directory", help="results directory of the campaign")
+    args = parser.parse_args()
+
+    print(summarize_running_statistics(load_running_statistics(args.result_directory)))
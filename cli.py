@@ -0,0 +1,138 @@
+import argparse  # Import argparse to parse the subcommands and their options
+import importlib  # Import importlib to import the modules of a subcommand when it runs
+import os  # Import os to locate the configuration saved in a results directory
+from main import load_config  # Import the configuration loader function
+
+# Modules of the pipeline imported by each subcommand. They are only imported once the subcommand runs, so that
+# subcommands which do not need bilby (and through it LAL and scipy), matplotlib or pandas do not pay for importing
+# them; e.g. generate only imports numpy.
+SUBCOMMAND_MODULES = {
+    "generate": ("generate_population",),
+    "estimate": ("parameter_estimation",),
+    "bias": ("bias_calculation",),
+    "viz": ("waveform_viz",),
+    "plot": ("bias_distribution",),
+}
+
+# Bias tables which the bias subcommand can calculate
+BIAS_TABLES = ("events", "sweep", "comparison")
+
+def import_subcommand(name):
+    """
+    Import the modules of a subcommand.
+
+    Args:
+        name (str): Name of the subcommand, one of SUBCOMMAND_MODULES.
+
+    Returns:
+        list: The imported modules, in the order of SUBCOMMAND_MODULES[name].
+    """
+    return [importlib.import_module(module) for module in SUBCOMMAND_MODULES[name]]
+
+def run_config(result_directory, config_file=None):
+    """
+    Load the configuration of a run.
+
+    Args:
+        result_directory (str): Directory where the results of the run are stored.
+        config_file (str, optional): Configuration file to use. Defaults to None, which uses the configuration saved
+                                     in the results directory, or config.yaml if the directory has none.
+
+    Returns:
+        dict: The configuration dictionary.
+    """
+    if config_file is None:
+        saved_config = os.path.join(result_directory, 'config.yaml')
+        config_file = saved_config if os.path.exists(saved_config) else 'config.yaml'
+    return load_config(config_file)
+
+def run_subcommand(args):
+    """
+    Run a subcommand with its parsed command line options.
+
+    Args:
+        args (argparse.Namespace): Options parsed by the parser of build_parser.
+
+    Returns:
+        The return value of the function run by the subcommand.
+    """
+    module, = import_subcommand(args.command)
+
+    if args.command == "plot":
+        return module.plot_bias_distributions(args.bias_file, args.columns, args.bins)
+
+    config = run_config(args.result_directory, args.config)
+
+    if args.command == "generate":
+        os.makedirs(args.result_directory, exist_ok=True)
+        return module.generate_population(config, result_directory=args.result_directory)
+
+    if args.command == "estimate":
+        return module.run_parameter_estimation(config, args.result_directory, corner_plot=args.corner_plot,
+                                               retry_failed=args.retry_failed)
+
+    if args.command == "bias":
+        calculate = {
+            "events": module.calculate_bias,
+            "sweep": module.calculate_reference_frequency_bias,
+            "comparison": module.calculate_approximant_bias,
+        }[args.table]
+        return calculate(config, result_directory=args.result_directory)
+
+    if args.command == "viz":
+        return module.main(
+            config=config,
+            result_path=args.result_directory,
+            injection_model=args.injection_model or config["waveform_approximant_injection"],
+            evaluation_model=args.evaluation_model or config["waveform_approximant_estimation"],
+            ref_frequency=args.reference_frequency or config["reference_frequency"],
+            plot=not args.no_plot,
+        )
+
+    raise ValueError(f"Unknown subcommand {args.command}; choose one of {', '.join(SUBCOMMAND_MODULES)}.")
+
+def build_parser():
+    """
+    Build the parser of the command line interface.
+
+    Returns:
+        argparse.ArgumentParser: Parser with one subparser per subcommand of SUBCOMMAND_MODULES.
+    """
+    parser = argparse.ArgumentParser(description="Run a single stage of the IMBH bias pipeline.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = subparsers.add_parser("generate", help="generate a population of IMBH binaries")
+    generate_parser.add_argument("result_directory", nargs="?", default=".", help="directory to save the population to")
+
+    estimate_parser = subparsers.add_parser("estimate", help="run the parameter estimation of a population")
+    estimate_parser.add_argument("result_directory", help="results directory containing the population")
+    estimate_parser.add_argument("--corner-plot", action="store_true", help="save a corner plot of each event")
+    estimate_parser.add_argument("--retry-failed", action="store_true", help="run failed events again")
+
+    bias_parser = subparsers.add_parser("bias", help="calculate the biases of the estimated parameters")
+    bias_parser.add_argument("result_directory", help="results directory containing the posteriors")
+    bias_parser.add_argument("--table", choices=BIAS_TABLES, default="events",
+                             help="bias table of a regular run, a reference frequency sweep or an approximant "
+                                  "comparison")
+
+    viz_parser = subparsers.add_parser("viz", help="compare the injected and estimated waveforms")
+    viz_parser.add_argument("result_directory", help="results directory containing the posteriors")
+    viz_parser.add_argument("--injection-model", default=None, help="approximant of the injected waveform")
+    viz_parser.add_argument("--evaluation-model", default=None, help="approximant the waveforms are evaluated with")
+    viz_parser.add_argument("--reference-frequency", type=float, default=None, help="reference frequency in Hz")
+    viz_parser.add_argument("--no-plot", action="store_true", help="only print the mismatches")
+
+    plot_parser = subparsers.add_parser("plot", help="plot the distributions of two bias columns")
+    plot_parser.add_argument("bias_file", help="bias table (CSV or Arrow file)")
+    plot_parser.add_argument("--columns", nargs=2, default=["mass_1", "mass_2"], help="two columns to plot")
+    plot_parser.add_argument("--bins", type=int, default=20, help="number of bins of the histograms")
+
+    for subparser in (generate_parser, estimate_parser, bias_parser, viz_parser):
+        subparser.add_argument("--config", default=None,
+                               help="configuration file (defaults to the configuration saved in the results "
+                                    "directory, or config.yaml)")
+
+    return parser
+
+if __name__ == "__main__":
+    run_subcommand(build_parser().parse_args())
@@ -0,0 +1,126 @@
+import copy  # Import copy to hand out independent copies of the cached detector data
+import bilby  # Import bilby for gravitational wave data analysis
+import numpy as np  # Import numpy to derive the noise seed of each event
+
+# Noisy interferometers keyed by (detectors, duration, sampling_frequency, start_time, seed)
+_interferometer_cache = {}
+
+def build_interferometers(detectors, duration, sampling_frequency, start_time, seed=None):
+    """
+    Build interferometers with noise generated from their power spectral densities.
+
+    Args:
+        detectors (list): Names of the detectors (e.g., ["H1", "L1"]).
+        duration (float): Duration of the data in seconds.
+        sampling_frequency (float): Sampling frequency of the data in Hz.
+        start_time (float): GPS start time of the data.
+        seed (int, optional): Seed of the noise realization. Defaults to None, which draws random noise.
+
+    Returns:
+        bilby.gw.detector.InterferometerList: Interferometers containing the noisy strain data.
+    """
+    # Seed bilby's random number generator so that the noise realization is reproducible
+    if seed is not None:
+        bilby.core.utils.random.seed(seed)
+
+    ifos = bilby.gw.detector.InterferometerList(list(detectors))
+    ifos.set_strain_data_from_power_spectral_densities(
+        sampling_frequency=sampling_frequency,
+        duration=duration,
+        start_time=start_time,
+    )
+
+    # Evaluate the frequency-domain strain once so that copies do not have to transform the data again
+    for ifo in ifos:
+        ifo.strain_data.frequency_domain_strain
+
+    return ifos
+
+def get_interferometers(detectors, duration, sampling_frequency, start_time, seed=None):
+    """
+    Get a private copy of noisy interferometers, building the noise only once per set of settings.
+
+    Args:
+        detectors (list): Names of the detectors (e.g., ["H1", "L1"]).
+        duration (float): Duration of the data in seconds.
+        sampling_frequency (float): Sampling frequency of the data in Hz.
+        start_time (float): GPS start time of the data.
+        seed (int, optional): Seed of the noise realization. Defaults to None.
+
+    Returns:
+        bilby.gw.detector.InterferometerList: A copy of the cached interferometers which can be modified, e.g. by
+                                              injecting a signal, without affecting the cache.
+
+    Seeded noise is cached per process and reused for every call with the same settings. Without a seed every call
+    draws a new noise realization, since reusing it would silently correlate events which expect independent noise.
+    """
+    if seed is None:
+        return build_interferometers(detectors, duration, sampling_frequency, start_time)
+
+    key = (tuple(detectors), duration, sampling_frequency, start_time, seed)
+    if key not in _interferometer_cache:
+        _interferometer_cache[key] = build_interferometers(
+            detectors, duration, sampling_frequency, start_time, seed=seed
+        )
+
+    return copy.deepcopy(_interferometer_cache[key])
+
+def event_noise_seed(config, index):
+    """
+    Derive the seed of the noise realization of a single event.
+
+    Args:
+        config (dict): Configuration dictionary with the optional key "noise_run_seed".
+        index (int): Index of the event in the population.
+
+    Returns:
+        int or None: Seed derived from the run seed and the event index, or None if the configuration has no run seed.
+    """
+    if config.get("noise_run_seed") is None:
+        return None
+    return int(np.random.SeedSequence([config["noise_run_seed"], index]).generate_state(1)[0])
+
+def has_reproducible_noise(config):
+    """
+    Check whether the noise of an event is the same every time its data is built.
+
+    Args:
+        config (dict): Configuration dictionary with the optional keys "noise_seed" and "noise_run_seed".
+
+    Returns:
+        bool: True if either seed is set, so that e.g. an interrupted event can resume on the same data.
+    """
+    return config.get("noise_seed") is not None or config.get("noise_run_seed") is not None
+
+def interferometers_from_config(config, index=None):
+    """
+    Get noisy interferometers for the detector setup of the configuration.
+
+    Args:
+        config (dict): Configuration dictionary with the keys "detector_setup", "duration", "sampling_frequency",
+                       "geocent_time" and the optional keys "noise_seed" and "noise_run_seed".
+        index (int, optional): Index of the event the data is built for. Defaults to None.
+
+    Returns:
+        bilby.gw.detector.InterferometerList: Interferometers with noise; the data starts 2 seconds before the
+                                              geocentric time of the events.
+
+    If "noise_seed" is set, all events share one cached noise realization. Otherwise, if "noise_run_seed" is set and
+    an event index is given, the event gets its own noise realization derived from both (see event_noise_seed), which
+    is the same every time the data of the event is built. Without either seed every call draws random noise.
+    """
+    settings = (config["detector_setup"], config["duration"], config["sampling_frequency"], config["geocent_time"] - 2)
+    if config.get("noise_seed") is not None:
+        return get_interferometers(*settings, seed=config["noise_seed"])
+
+    # The noise of an event is only used once per process, so it is not cached
+    return build_interferometers(*settings, seed=event_noise_seed(config, index) if index is not None else None)
+
+def clear_interferometer_cache():
+    """
+    Remove all cached interferometers of the current process.
+
+    Returns:
+        None.
+    """
+    _interferometer_cache.clear()
@@ -1,2 +1,19 @@
-import gwsurrogate
-gwsurrogate.LoadSurrogate('NRSur7dq4')
\ No newline at end of file
+import argparse  # Import argparse to parse command line options
+from main import load_config  # Import the configuration loader function
+from surrogate_data import SURROGATE_DATA_FILES, download_surrogate_data, required_surrogates  # Import the surrogate data management
+
+if __name__ == "__main__":
+    # Parse the command line options
+    parser = argparse.ArgumentParser(description="Download the data files of the surrogate approximants.")
+    parser.add_argument("approximants", nargs="*", metavar="APPROXIMANT",
+                        help=f"surrogate approximants to download, of {', '.join(sorted(SURROGATE_DATA_FILES))} "
+                             f"(defaults to those used by the configuration, or NRSur7dq4)")
+    parser.add_argument("--config", default="config.yaml", help="configuration file")
+    args = parser.parse_args()
+    unknown = sorted(set(args.approximants) - set(SURROGATE_DATA_FILES))
+    if unknown:
+        parser.error(f"unknown surrogate approximants {', '.join(unknown)}")
+
+    config = load_config(args.config)
+    for approximant in args.approximants or required_surrogates(config) or ["NRSur7dq4"]:
+        print(f"{approximant} data available at {download_surrogate_data(config, approximant)}")
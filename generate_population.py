@@ -1,52 +1,232 @@
+import os  # Import os to handle file operations
+import queue  # Import queue to hand the generated chunks to the thread writing them
+import threading  # Import threading to write the population file while its events are being processed
 import numpy as np  # Import numpy for numerical operations
-import json  # Import json to handle JSON file operations
+from storage import chunk_to_events, population_path, save_population  # Import the storage layer to write the population file
+
+# Distributions which can be selected with the "distribution" key of each parameter
+DISTRIBUTIONS = ("uniform", "log_uniform", "power_law", "sine", "cosine", "comoving_volume")
+
+def comoving_volume_sampler(minimum, maximum, num_points=1000):
+    """
+    Create a sampler of luminosity distances distributed uniformly in comoving volume.
+
+    Args:
+        minimum (float): Minimum luminosity distance in Mpc.
+        maximum (float): Maximum luminosity distance in Mpc.
+        num_points (int): Number of redshift grid points used to tabulate the inverse cumulative distribution.
+
+    Returns:
+        callable: Function mapping an array of uniform random numbers in [0, 1) to luminosity distances.
+
+    The distance-redshift relation of the Planck15 cosmology is tabulated once, so drawing samples only costs an
+    interpolation.
+    """
+    # Import astropy only when this distribution is used, since it is slow to import
+    from astropy import cosmology, units
+
+    cosmo = cosmology.Planck15
+    redshift_min = cosmology.z_at_value(cosmo.luminosity_distance, minimum * units.Mpc).value if minimum > 0 else 0.0
+    redshift_max = cosmology.z_at_value(cosmo.luminosity_distance, maximum * units.Mpc).value
+
+    # Tabulate the cumulative distribution of the comoving volume over the redshift range
+    redshifts = np.linspace(redshift_min, redshift_max, num_points)
+    volume = cosmo.comoving_volume(redshifts).value
+    cdf = (volume - volume[0]) / (volume[-1] - volume[0])
+    distances = cosmo.luminosity_distance(redshifts).value
+
+    return lambda uniform: np.interp(uniform, cdf, distances)
+
+def create_sampler(bounds):
+    """
+    Create a vectorized sampler for a single parameter.
+
+    Args:
+        bounds (dict): Specification of the parameter with the keys "min" and "max" and the optional keys
+                       "distribution" (one of DISTRIBUTIONS, defaults to "uniform") and "alpha" (the spectral index
+                       of the "power_law" distribution).
+
+    Returns:
+        callable: Function taking a numpy random Generator and a number of samples and returning an array of samples.
+
+    The distributions are:
+        - "uniform": uniform between min and max.
+        - "log_uniform": uniform in the logarithm of the parameter.
+        - "power_law": probability density proportional to x**alpha.
+        - "sine": probability density proportional to sin(x), i.e. isotropic for polar angles such as theta_jn.
+        - "cosine": probability density proportional to cos(x), i.e. isotropic for declinations.
+        - "comoving_volume": luminosity distances (in Mpc) uniform in comoving volume.
+    """
+    minimum = bounds.get("min")
+    maximum = bounds.get("max")
+    distribution = bounds.get("distribution", "uniform")
+
+    # If min and max are equal, the parameter is fixed
+    if minimum == maximum:
+        return lambda rng, size: np.full(size, float(minimum))
+
+    if distribution == "uniform":
+        return lambda rng, size: rng.uniform(minimum, maximum, size)
+
+    if distribution == "log_uniform" or (distribution == "power_law" and bounds["alpha"] == -1):
+        log_minimum, log_maximum = np.log(minimum), np.log(maximum)
+        return lambda rng, size: np.exp(rng.uniform(log_minimum, log_maximum, size))
+
+    if distribution == "power_law":
+        # Invert the cumulative distribution of x**alpha
+        exponent = bounds["alpha"] + 1
+        low, high = minimum ** exponent, maximum ** exponent
+        return lambda rng, size: (low + rng.uniform(size=size) * (high - low)) ** (1 / exponent)
+
+    if distribution == "sine":
+        cos_minimum, cos_maximum = np.cos(minimum), np.cos(maximum)
+        return lambda rng, size: np.arccos(cos_minimum - rng.uniform(size=size) * (cos_minimum - cos_maximum))
+
+    if distribution == "cosine":
+        sin_minimum, sin_maximum = np.sin(minimum), np.sin(maximum)
+        return lambda rng, size: np.arcsin(sin_minimum + rng.uniform(size=size) * (sin_maximum - sin_minimum))
+
+    if distribution == "comoving_volume":
+        inverse_cdf = comoving_volume_sampler(minimum, maximum)
+        return lambda rng, size: inverse_cdf(rng.uniform(size=size))
+
+    raise ValueError(f"Unknown distribution {distribution}; choose one of {', '.join(DISTRIBUTIONS)}.")
+
+def iter_population_chunks(config, seed=None, chunk_size=None):
+    """
+    Generate the population in chunks of columnar arrays.
+
+    Args:
+        config (dict): Configuration dictionary with the keys "num_events" and "parameters", and the optional keys
+                       "population_seed" and "population_chunk_size".
+        seed (int, optional): Seed of the random number generators. Defaults to "population_seed" (unseeded if that
+                              is missing or null).
+        chunk_size (int, optional): Maximum number of events per chunk. Defaults to "population_chunk_size", or
+                                    100000 if that is missing.
+
+    Yields:
+        dict: Mapping from parameter name to a numpy array with the values of the events in the chunk.
+
+    Every parameter draws from its own random number generator spawned from the seed, so that a seeded population
+    does not depend on the chunk size.
+    """
+    if seed is None:
+        seed = config.get("population_seed")
+    if chunk_size is None:
+        chunk_size = config.get("population_chunk_size", 100000)
+
+    num_events = config["num_events"]
+    parameters = config.get("parameters", {})
+
+    # Build the samplers once, since some distributions tabulate their inverse cumulative distribution
+    samplers = {param_name: create_sampler(bounds) for param_name, bounds in parameters.items()}
+    rngs = dict(zip(parameters, (np.random.default_rng(child) for child in
+                                 np.random.SeedSequence(seed).spawn(len(parameters)))))
+
+    for start in range(0, num_events, chunk_size):
+        size = min(chunk_size, num_events - start)
+        yield {param_name: sampler(rngs[param_name], size) for param_name, sampler in samplers.items()}
 
 def generate_population(config, result_directory):
     """
     Generate a population of intermediate-mass black hole (IMBH) binaries based on given configuration.
 
     Args:
-        config (dict): Configuration dictionary containing parameters for population generation. 
+        config (dict): Configuration dictionary containing parameters for population generation.
                        It should have the following keys:
                        - "num_events" (int): Number of events to generate.
-                       - "parameters" (dict): Dictionary where each key is a parameter name and the value is a dictionary 
-                         with "min" and "max" values defining the range of that parameter.
+                       - "parameters" (dict): Dictionary where each key is a parameter name and the value is a dictionary
+                         with "min" and "max" values defining the range of that parameter, and optionally the
+                         "distribution" (see create_sampler) to draw it from.
                        - "population_file" (str): Name of the file to save the generated population data.
+                       Optional keys are "population_seed" (seed of the random number generator),
+                       "population_chunk_size" (number of events generated and written at once) and
+                       "population_format" ("json", "csv" or "arrow").
         result_directory (str): Directory where the resulting population file will be saved.
 
     Returns:
-        None. The generated population data is saved to a JSON file specified by the 'population_file' key in the config.
-    
-    The function generates random parameters for each event within the specified bounds 
-    and saves the generated population to a JSON file.
+        None. The generated population data is saved to the file given by storage.population_path.
+
+    The function draws all events of a chunk at once for each parameter from a seeded numpy random Generator.
+    In the "csv" and "arrow" formats each chunk is written to the file as soon as it is generated, so that large
+    populations never have to be held in memory; the "json" format keeps the original list of dictionaries for
+    compatibility.
     """
-    
+
     # Extract the number of events to generate from the configuration
     num_events = config["num_events"]
 
-    # Initialize a list to store parameters for each event
-    population_parameters = []
+    # Generate the population chunk by chunk and save each chunk through the storage layer
+    path = save_population(result_directory, config, iter_population_chunks(config))
 
-    # Generate random parameters for each event
-    for _ in range(num_events):
-        params = {}  # Dictionary to store parameters for a single event
-        parameters = config.get("parameters", {})  # Get parameter ranges from the configuration
+    # Print a message indicating the successful generation and saving of the population data
+    print(f"Population of {num_events} IMBH binaries generated and saved to {path}")
 
-        # Generate random values for each parameter within the specified bounds
-        for param_name, bounds in parameters.items():
-            params[param_name] = np.random.uniform(bounds.get("min"), bounds.get("max"))
-        
-        # Append the generated parameters for the event to the population list
-        population_parameters.append(params)
+def stream_population(config, result_directory):
+    """
+    Generate a population and hand out its events while it is being generated and saved.
 
-    # Save the generated population to a JSON file
-    with open(f"{result_directory}/{config['population_file']}", 'w') as f:
-        json.dump(population_parameters, f, indent=4)
+    Args:
+        config (dict): Configuration dictionary as described in generate_population.
+        result_directory (str): Directory where the resulting population file will be saved.
 
-    # Print a message indicating the successful generation and saving of the population data
-    print(f"Population of {num_events} IMBH binaries generated and saved to {result_directory}/{config['population_file']}")
+    Yields:
+        tuple: The index and the parameter dictionary of each event, in the order of the population.
+
+    A chunk is only generated once all events of the previous chunk have been taken, so generation never runs ahead
+    of the consumer by more than one chunk. A background thread writes the chunks through the storage layer to a
+    temporary file, which replaces the population file once the whole population has been generated; an interrupted
+    stream therefore never leaves a partial population file behind. Use a seeded configuration, so that the
+    population of an interrupted run can be generated again identically.
+    """
+    path = population_path(result_directory, config)
+    temporary_path = f"{path}.tmp"
+
+    # At most one chunk waits to be written, so the writer applies backpressure as well
+    chunk_queue = queue.Queue(maxsize=1)
+    errors = []
+
+    def write():
+        try:
+            save_population(result_directory, config, iter(chunk_queue.get, None), path=temporary_path)
+        except Exception as e:
+            errors.append(e)
+            # Keep draining the queue so that the generator never blocks on a failed writer
+            while chunk_queue.get() is not None:
+                pass
+
+    writer = threading.Thread(target=write, daemon=True)
+    writer.start()
+
+    complete = False
+    try:
+        start = 0
+        for chunk in iter_population_chunks(config):
+            chunk_queue.put(chunk)
+            for params in chunk_to_events(chunk):
+                yield start, params
+                start += 1
+        complete = True
+    finally:
+        chunk_queue.put(None)
+        writer.join()
+        if complete and not errors:
+            os.replace(temporary_path, path)
+            print(f"Population of {config['num_events']} IMBH binaries generated and saved to {path}")
+        elif os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+    if errors:
+        raise errors[0]
 
-# The following block allows the script to be run independently but is incomplete here.
 if __name__ == "__main__":
-    # Example configuration and result directory should be defined here to run the function
-    generate_population()
\ No newline at end of file
+    import argparse  # Import argparse to parse command line options
+    from main import load_config  # Import the configuration loader function
+
+    # Parse the command line options
+    parser = argparse.ArgumentParser(description="Generate a population of IMBH binaries.")
+    parser.add_argument("result_directory", nargs="?", default=".", help="directory to save the population to")
+    parser.add_argument("--config", default="config.yaml", help="configuration file")
+    args = parser.parse_args()
+
+    generate_population(load_config(args.config), result_directory=args.result_directory)
@@ -0,0 +1,215 @@
+import cProfile  # Import cProfile for the optional profiling of the sampler
+import glob  # Import glob to find the files written for an event
+import json  # Import json to write the metrics files
+import os  # Import os to handle file operations
+import platform  # Import platform to interpret the memory usage reported by the operating system
+import resource  # Import resource to measure the peak memory usage of the process and its children
+import shutil  # Import shutil to find the py-spy executable
+import signal  # Import signal to stop py-spy once the profiled call has finished
+import subprocess  # Import subprocess to attach py-spy to the current process
+import time  # Import time to measure wall times
+from contextlib import contextmanager  # Import contextmanager to time stages with a with statement
+
+# Directory inside a results directory holding the metrics files
+METRICS_DIRECTORY = "metrics"
+
+# Directory inside a results directory holding the profiles of the sampler
+PROFILE_DIRECTORY = "profiles"
+
+# Profilers which can be selected with the "sampler_profiler" key of the configuration
+PROFILERS = ("cprofile", "py-spy")
+
+# Largest memory high-water mark of the current process, in megabytes, before the high-water mark was last reset by
+# start_memory_tracking
+_peak_rss_before_reset = 0.0
+
+def peak_rss_megabytes(who=resource.RUSAGE_SELF):
+    """
+    Get the peak resident set size of the current process, or of its terminated child processes.
+
+    Args:
+        who (int): resource.RUSAGE_SELF for the current process, or resource.RUSAGE_CHILDREN for the largest of its
+                   terminated and waited for child processes (e.g. the workers of a sampler pool).
+
+    Returns:
+        float: The memory high-water mark in megabytes since the process started, including the peaks before the
+               high-water mark was reset by start_memory_tracking.
+    """
+    # ru_maxrss is given in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    peak = peak / 1024 ** 2 if platform.system() == "Darwin" else peak / 1024
+    return max(peak, _peak_rss_before_reset) if who == resource.RUSAGE_SELF else peak
+
+def _reset_peak_rss():
+    # Linux resets the memory high-water mark of a process when 5 is written to its clear_refs file
+    try:
+        with open("/proc/self/clear_refs", 'w') as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+def _current_peak_rss_megabytes():
+    # Memory high-water mark since the last reset, given in kilobytes
+    with open("/proc/self/status", 'r') as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return peak_rss_megabytes()
+
+def start_memory_tracking():
+    """
+    Start measuring the memory usage of an event.
+
+    Returns:
+        dict: State to pass to memory_usage once the event has finished.
+
+    The high-water mark of the process is reset where the operating system allows it (Linux), so that a worker which
+    runs several events reports the peak of each event rather than the largest peak of the events before. The reset
+    is global to the process: it also lowers ru_maxrss and VmHWM, so the peak before the reset is kept and folded
+    into peak_rss_megabytes, which still reports the peak of the whole process.
+    """
+    global _peak_rss_before_reset
+    # ru_maxrss is at least the high-water mark VmHWM which is about to be reset
+    _peak_rss_before_reset = peak_rss_megabytes()
+    return {
+        "reset": _reset_peak_rss(),
+        "children_peak_rss_megabytes": peak_rss_megabytes(resource.RUSAGE_CHILDREN),
+    }
+
+def memory_usage(tracking):
+    """
+    Measure the memory usage of an event.
+
+    Args:
+        tracking (dict): State returned by start_memory_tracking at the start of the event.
+
+    Returns:
+        dict: "peak_rss_megabytes", the memory high-water mark of the process during the event (since the process
+              started where it cannot be reset), and "children_peak_rss_megabytes", the peak of the largest child
+              process which terminated during the event, e.g. a worker of the sampler pool. The latter is None if no
+              child process exceeded the peak of the child processes before the event, as only the largest peak
+              since the process started is known.
+    """
+    children_peak = peak_rss_megabytes(resource.RUSAGE_CHILDREN)
+    return {
+        "peak_rss_megabytes": _current_peak_rss_megabytes() if tracking["reset"] else peak_rss_megabytes(),
+        "children_peak_rss_megabytes": (
+            children_peak if children_peak > tracking["children_peak_rss_megabytes"] else None
+        ),
+    }
+
+@contextmanager
+def stage_timer(metrics, name):
+    """
+    Measure the wall time of a stage and add it to the metrics.
+
+    Args:
+        metrics (dict): Metrics to update; the time is added to metrics["stages"][name] in seconds, so that a stage
+                        which runs several times accumulates its total time.
+        name (str): Name of the stage.
+
+    Yields:
+        None.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages = metrics.setdefault("stages", {})
+        stages[name] = stages.get(name, 0.0) + time.perf_counter() - start
+
+def bytes_written(result_directory, label, extra_paths=()):
+    """
+    Sum the size of the files written for an event.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+        label (str): Label of the event; all files in the results directory starting with it are counted.
+        extra_paths (iterable): Further files of the event, e.g. its posterior file in the storage layer.
+
+    Returns:
+        int: Total size in bytes of the existing files.
+    """
+    paths = set(glob.glob(os.path.join(result_directory, f"{label}_*"))) | set(extra_paths)
+    return sum(os.path.getsize(path) for path in paths if os.path.isfile(path))
+
+def write_metrics(result_directory, name, metrics):
+    """
+    Write metrics to a JSON file in the metrics directory.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+        name (str): Name of the metrics file without extension, e.g. "event_3" or "pipeline".
+        metrics (dict): Metrics to write.
+
+    Returns:
+        str: Path of the metrics file.
+    """
+    directory = os.path.join(result_directory, METRICS_DIRECTORY)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.json")
+    with open(path, 'w') as f:
+        json.dump(metrics, f, indent=4, sort_keys=True, default=str)
+    return path
+
+def load_metrics(result_directory):
+    """
+    Load the metrics of all events of a run.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+
+    Returns:
+        dict: Mapping from metrics file name (e.g. "event_3") to its metrics.
+    """
+    metrics = {}
+    for path in sorted(glob.glob(os.path.join(result_directory, METRICS_DIRECTORY, "*.json"))):
+        with open(path, 'r') as f:
+            metrics[os.path.splitext(os.path.basename(path))[0]] = json.load(f)
+    return metrics
+
+def profiled_call(profiler, profile_path, function, *args, **kwargs):
+    """
+    Call a function, optionally under a profiler.
+
+    Args:
+        profiler (str or None): One of PROFILERS, or None to call the function without profiling.
+        profile_path (str): Path of the profile without extension. cProfile writes "<profile_path>.prof" (readable
+                            with pstats or snakeviz); py-spy writes a flame graph "<profile_path>.svg".
+        function (callable): Function to call.
+        *args, **kwargs: Arguments of the function.
+
+    Returns:
+        The return value of the function.
+
+    py-spy is attached to the current process from outside, so it also samples native frames and the worker
+    processes of the sampler; it requires the py-spy executable and permission to trace the process.
+    """
+    if profiler is None:
+        return function(*args, **kwargs)
+
+    os.makedirs(os.path.dirname(profile_path) or ".", exist_ok=True)
+
+    if profiler == "cprofile":
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(function, *args, **kwargs)
+        finally:
+            profile.dump_stats(f"{profile_path}.prof")
+
+    if profiler == "py-spy":
+        executable = shutil.which("py-spy")
+        if executable is None:
+            raise RuntimeError("The py-spy profiler was requested but the py-spy executable was not found.")
+        recorder = subprocess.Popen([
+            executable, "record", "--pid", str(os.getpid()), "--subprocesses", "--output", f"{profile_path}.svg",
+        ])
+        try:
+            return function(*args, **kwargs)
+        finally:
+            # py-spy writes its output when it is interrupted
+            recorder.send_signal(signal.SIGINT)
+            recorder.wait()
+
+    raise ValueError(f"Unknown profiler {profiler}; choose one of {', '.join(PROFILERS)}.")
@@ -0,0 +1,96 @@
+import os  # Import os to handle file paths
+
+# The layout of the results directories is kept apart from parameter_estimation, so that the bias calculation and the
+# command line interface can locate results without importing bilby.
+
+# Directory inside a results directory holding one results directory per reference frequency of a sweep
+SWEEP_DIRECTORY = "reference_frequency_sweep"
+
+# Directory inside a results directory holding one results directory per estimation approximant of a comparison
+COMPARISON_DIRECTORY = "approximant_comparison"
+
+def event_label(index):
+    """
+    Build the label used for the output files of a single event.
+
+    Args:
+        index (int): Index of the event in the population.
+
+    Returns:
+        str: Label passed to the sampler, e.g. "event_3" which results in "event_3_result.json".
+    """
+    return f"event_{index}"
+
+def reference_frequency_candidates(config, start_frequency=None):
+    """
+    List the reference frequencies to try, from the initial reference frequency up to the maximum one.
+
+    Args:
+        config (dict): Configuration dictionary with the keys "reference_frequency", "max_reference_frequency" and
+                       "reference_frequency_steps".
+        start_frequency (float, optional): Frequency to start from instead of "reference_frequency".
+
+    Returns:
+        list: The candidate reference frequencies in increasing order.
+    """
+    frequency = start_frequency if start_frequency is not None else config["reference_frequency"]
+    candidates = []
+    while frequency <= config["max_reference_frequency"]:
+        candidates.append(frequency)
+        frequency += config["reference_frequency_steps"]
+    return candidates
+
+def sweep_frequencies(config):
+    """
+    List the reference frequencies of a reference frequency sweep.
+
+    Args:
+        config (dict): Configuration dictionary with the optional key "reference_frequency_sweep", a list of
+                       reference frequencies. If it is missing or null, the candidates of
+                       reference_frequency_candidates are swept.
+
+    Returns:
+        list: The reference frequencies of the sweep.
+    """
+    return list(config.get("reference_frequency_sweep") or reference_frequency_candidates(config))
+
+def sweep_directory(result_directory, reference_frequency):
+    """
+    Build the results directory of one reference frequency of a sweep.
+
+    Args:
+        result_directory (str): Directory where the results of the run are stored.
+        reference_frequency (float): Reference frequency of the estimation waveform.
+
+    Returns:
+        str: Path of the directory, which holds the results of all events at this reference frequency in the layout
+             of a regular run.
+    """
+    return os.path.join(result_directory, SWEEP_DIRECTORY, f"reference_frequency_{reference_frequency:g}")
+
+def comparison_approximants(config):
+    """
+    List the estimation approximants of an approximant comparison.
+
+    Args:
+        config (dict): Configuration dictionary with the optional key "comparison_approximants", a list of waveform
+                       approximants. If it is missing or null, only "waveform_approximant_estimation" is used.
+
+    Returns:
+        list: The estimation approximants of the comparison.
+    """
+    return list(config.get("comparison_approximants") or [config["waveform_approximant_estimation"]])
+
+def approximant_directory(result_directory, approximant):
+    """
+    Build the results directory of one estimation approximant of a comparison.
+
+    Args:
+        result_directory (str): Directory where the results of the run are stored.
+        approximant (str): Waveform approximant used for estimation.
+
+    Returns:
+        str: Path of the directory, which holds the results of all events estimated with this approximant in the
+             layout of a regular run.
+    """
+    return os.path.join(result_directory, COMPARISON_DIRECTORY, approximant)
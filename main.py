@@ -1,7 +1,6 @@
 import os  # Import os for handling file and directory operations
-from generate_population import generate_population  # Import function to generate population
-from parameter_estimation import run_parameter_estimation  # Import function to run parameter estimation
-from bias_calculation import calculate_bias  # Import function to calculate bias
+import argparse  # Import argparse to parse command line options
+from instrumentation import peak_rss_megabytes, stage_timer, write_metrics  # Import the instrumentation of the stages
 import yaml  # Import yaml for loading configuration files
 
 def load_config(config_file='config.yaml'):
@@ -50,33 +49,183 @@ def create_results_directory(base_dir):
     os.makedirs(new_dir)  # Create the new directory
     return new_dir
 
-def main():
+def save_config(config, result_directory, config_file='config.yaml'):
+    """
+    Save a copy of the configuration into the results directory so that an interrupted run can be resumed with the
+    same settings.
+
+    Args:
+        config (dict): Configuration dictionary to save.
+        result_directory (str): Directory where the results are stored.
+        config_file (str): Name of the configuration file inside the results directory. Defaults to 'config.yaml'.
+
+    Returns:
+        None.
+    """
+    with open(os.path.join(result_directory, config_file), 'w') as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+
+def main(resume_directory=None, retry_failed=False, stream=False, residuals=False, sweep=False,
+         compare_approximants=None):
     """
     Main function to run the full pipeline for gravitational wave analysis.
     This includes generating a population of events, running parameter estimation for each event,
     and calculating biases for the estimated parameters.
+
+    Args:
+        resume_directory (str, optional): Results directory of an interrupted run to resume. The configuration saved
+                                          in that directory is used, the existing population is kept, events which
+                                          are already done are skipped and interrupted samplers restart from their
+                                          checkpoint. Defaults to None, which starts a new run.
+        retry_failed (bool): Whether to run events again which failed in the resumed run. Defaults to False.
+        stream (bool): Whether to overlap the stages. Events are handed to the samplers while the population is
+                       still being generated, and at most "max_in_flight_events" events are queued at a time.
+                       Defaults to False, which generates the whole population first.
+        residuals (bool): Whether to also compute the waveform residuals of each event as soon as it has finished,
+                          saved to the residuals directory. Defaults to False.
+        sweep (bool): Whether to run a reference frequency sweep instead: every event is injected once and estimated
+                      at each reference frequency of the sweep, and the biases are saved to a bias-vs-reference
+                      frequency table. Defaults to False.
+        compare_approximants (list, optional): Whether to run an approximant comparison instead: every event is
+                                               injected once and estimated with each approximant of the list (or,
+                                               if the list is empty, of "comparison_approximants" in the
+                                               configuration), and the biases are saved to a bias table with an
+                                               approximant column. Defaults to None, which runs no comparison.
     """
-    # Load the configuration from the YAML file
-    config = load_config()
+    # The stages are imported here rather than at the top of the module, so that importing load_config from this
+    # module (as the stand-alone scripts and the command line interface do) does not import bilby and matplotlib
+    import numpy as np  # Import numpy to draw the seed of a streamed population
+    from generate_population import generate_population, stream_population  # Import functions to generate population
+    from storage import population_path  # Import function to locate the population file
+    from parameter_estimation import (  # Import functions to run parameter estimation
+        run_approximant_comparison,
+        run_parameter_estimation,
+        run_reference_frequency_sweep,
+    )
+    from bias_calculation import (  # Import functions to calculate biases
+        calculate_approximant_bias,
+        calculate_bias,
+        calculate_reference_frequency_bias,
+        update_event_bias,
+    )
+    from waveform_viz import record_event_residuals  # Import function to compute the waveform residuals of an event
+    from surrogate_data import check_surrogate_data  # Import the check of the surrogate data
 
-    # Ensure the results directory exists or create a new one
-    dir = create_results_directory(config['results_dir'])
+    if resume_directory is None:
+        # Load the configuration from the YAML file
+        config = load_config()
+        if compare_approximants:
+            config["comparison_approximants"] = list(compare_approximants)
 
-    # Step 1: Generate the population of intermediate-mass black hole (IMBH) binaries
-    print("Generating the population of IMBH binaries...")
-    generate_population(config=config, result_directory=dir)
+        # Check the surrogate data before any stage runs, so that a missing file stops the run at once
+        check_surrogate_data(config)
+
+        # Ensure the results directory exists or create a new one
+        dir = create_results_directory(config['results_dir'])
+
+        # A streamed population is only saved once it is complete, so fix its seed to be able to generate the same
+        # population again when the run is resumed
+        if stream and config.get("population_seed") is None:
+            config["population_seed"] = np.random.SeedSequence().entropy
+        # Fix the seed of the noise of each event, so that a resumed event is analysed on the same data
+        if config.get("noise_seed") is None and config.get("noise_run_seed") is None:
+            config["noise_run_seed"] = np.random.SeedSequence().entropy
+        save_config(config, dir)
+    else:
+        # Continue an existing run with the configuration it was started with
+        if not os.path.isdir(resume_directory):
+            raise FileNotFoundError(f"Cannot resume: results directory {resume_directory} does not exist.")
+        dir = resume_directory
+        saved_config = os.path.join(dir, 'config.yaml')
+        config = load_config(saved_config if os.path.exists(saved_config) else 'config.yaml')
+        print(f"Resuming the run in {dir}...")
+
+        # Approximants added to a resumed comparison only run the missing approximants
+        if compare_approximants:
+            config["comparison_approximants"] = list(compare_approximants)
+            save_config(config, dir)
+        check_surrogate_data(config)
+
+    # Wall time of each stage of the pipeline, written to metrics/pipeline.json
+    pipeline_metrics = {}
+
+    # Record the bias (and optionally the waveform residuals) of each event as soon as its result is available
+    def record_bias(summary, params):
+        if summary["success"]:
+            update_event_bias(config, dir, summary["event"], params)
+            if residuals:
+                record_event_residuals(config, dir, summary["event"], params, summary["reference_frequency"])
+
+    if resume_directory is not None and os.path.exists(population_path(dir, config)):
+        print("Using the existing population of IMBH binaries...")
+        events = None
+    elif stream and not sweep and compare_approximants is None:
+        print("Streaming the population of IMBH binaries into the parameter estimation...")
+        events = stream_population(config, dir)
+    else:
+        # Step 1: Generate the population of intermediate-mass black hole (IMBH) binaries
+        print("Generating the population of IMBH binaries...")
+        with stage_timer(pipeline_metrics, "generate_population"):
+            generate_population(config=config, result_directory=dir)
+        events = None
     
-    # Step 2: Perform parameter estimation for each event in the population
+    if sweep or compare_approximants is not None:
+        # Steps 2 and 3 of a sweep or comparison: estimate every event in each variant on the same data and tabulate
+        # the biases against the reference frequency or the approximant
+        if sweep:
+            stage, run_variants, calculate_variant_bias = (
+                "reference_frequency_sweep", run_reference_frequency_sweep, calculate_reference_frequency_bias
+            )
+        else:
+            stage, run_variants, calculate_variant_bias = (
+                "approximant_comparison", run_approximant_comparison, calculate_approximant_bias
+            )
+        with stage_timer(pipeline_metrics, stage):
+            run_variants(config=config, result_directory=dir)
+        with stage_timer(pipeline_metrics, "bias_calculation"):
+            calculate_variant_bias(config=config, result_directory=dir)
+        pipeline_metrics["peak_rss_megabytes"] = peak_rss_megabytes()
+        write_metrics(dir, "pipeline", pipeline_metrics)
+        print(f"The {stage.replace('_', ' ')} completed successfully.")
+        return
+
+    # Step 2: Perform parameter estimation for each event in the population; a streamed population is generated
+    # while the first events are running
     print("Running parameter estimation for each event in the population...")
-    run_parameter_estimation(config=config, result_directory=dir)
+    with stage_timer(pipeline_metrics, "parameter_estimation"):
+        run_parameter_estimation(config=config, result_directory=dir, retry_failed=retry_failed,
+                                 on_event_done=record_bias, events=events)
     
-    # Step 3: Calculate biases based on the estimation results
+    # Step 3: Calculate the biases of any remaining events and save the complete bias table
     print("Calculating biases for the estimated parameters...")
-    calculate_bias(config=config, result_directory=dir)
+    with stage_timer(pipeline_metrics, "bias_calculation"):
+        calculate_bias(config=config, result_directory=dir)
+
+    pipeline_metrics["peak_rss_megabytes"] = peak_rss_megabytes()
+    write_metrics(dir, "pipeline", pipeline_metrics)
 
     # Indicate completion of all steps
     print("All steps completed successfully. The bias results are saved in", config['bias_output_file'])
 
 if __name__ == "__main__":
+    # Parse the command line options
+    parser = argparse.ArgumentParser(description="Run the gravitational wave analysis pipeline.")
+    parser.add_argument("--resume", metavar="DIR", default=None,
+                        help="results directory of an interrupted run to resume")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="when resuming, also run events again which failed")
+    parser.add_argument("--stream", action="store_true",
+                        help="hand events to the samplers while the population is being generated")
+    parser.add_argument("--residuals", action="store_true",
+                        help="compute the waveform residuals of each event as soon as it has finished")
+    variants = parser.add_mutually_exclusive_group()
+    variants.add_argument("--sweep", action="store_true",
+                          help="estimate every event at each reference frequency of the sweep on the same data")
+    variants.add_argument("--compare-approximants", nargs="*", metavar="APPROXIMANT", default=None,
+                          help="estimate every event with each approximant on the same data (defaults to the "
+                               "comparison_approximants of the configuration)")
+    args = parser.parse_args()
+
     # Run the main function when the script is executed
-    main()
+    main(resume_directory=args.resume, retry_failed=args.retry_failed, stream=args.stream, residuals=args.residuals,
+         sweep=args.sweep, compare_approximants=args.compare_approximants)
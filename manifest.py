@@ -0,0 +1,113 @@
+import json  # Import json to handle JSON file operations
+import os  # Import os to handle file operations
+
+# Name of the manifest file stored in each results directory
+MANIFEST_FILE = "manifest.json"
+
+# Possible states of an event in the manifest
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+def manifest_path(result_directory):
+    """
+    Build the path of the run manifest inside a results directory.
+
+    Args:
+        result_directory (str): Directory where the results of the run are stored.
+
+    Returns:
+        str: Path of the manifest file.
+    """
+    return os.path.join(result_directory, MANIFEST_FILE)
+
+def save_manifest(result_directory, manifest):
+    """
+    Write the manifest to the results directory.
+
+    Args:
+        result_directory (str): Directory where the results of the run are stored.
+        manifest (dict): Manifest to save.
+
+    Returns:
+        None. The manifest is first written to a temporary file which then replaces the old manifest, so that a crash
+        while writing never leaves a truncated manifest behind.
+    """
+    path = manifest_path(result_directory)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, 'w') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(temporary_path, path)
+
+def load_manifest(result_directory):
+    """
+    Load the manifest of a results directory.
+
+    Args:
+        result_directory (str): Directory where the results of the run are stored.
+
+    Returns:
+        dict or None: The manifest, or None if the directory does not contain a manifest yet.
+    """
+    path = manifest_path(result_directory)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def create_manifest(result_directory, num_events):
+    """
+    Create a new manifest in which every event of the population is pending.
+
+    Args:
+        result_directory (str): Directory where the results of the run are stored.
+        num_events (int): Number of events in the population.
+
+    Returns:
+        dict: The created manifest. It maps the index of each event (as a string, since it is stored as JSON) to a
+              dictionary with the keys "state" and "reference_frequency".
+    """
+    manifest = {
+        "events": {
+            str(i): {"state": PENDING, "reference_frequency": None}
+            for i in range(num_events)
+        }
+    }
+    save_manifest(result_directory, manifest)
+    return manifest
+
+def update_event(result_directory, manifest, index, state, reference_frequency=None):
+    """
+    Update the state of a single event and save the manifest.
+
+    Args:
+        result_directory (str): Directory where the results of the run are stored.
+        manifest (dict): Manifest to update in place.
+        index (int): Index of the event in the population.
+        state (str): New state of the event, one of PENDING, RUNNING, DONE or FAILED.
+        reference_frequency (float, optional): Reference frequency used by the event. Only overwrites the stored
+                                               value if given.
+
+    Returns:
+        None. The updated manifest is saved to the results directory.
+    """
+    entry = manifest["events"].setdefault(str(index), {"state": PENDING, "reference_frequency": None})
+    entry["state"] = state
+    if reference_frequency is not None:
+        entry["reference_frequency"] = reference_frequency
+    save_manifest(result_directory, manifest)
+
+def event_state(manifest, index):
+    """
+    Get the state of a single event.
+
+    Args:
+        manifest (dict): Manifest of the run.
+        index (int): Index of the event in the population.
+
+    Returns:
+        str: State of the event; events missing from the manifest are pending.
+    """
+    return manifest["events"].get(str(index), {}).get("state", PENDING)
@@ -1,6 +1,128 @@
 import bilby  # Import bilby for gravitational wave data analysis
-import json  # Import json for handling JSON file operations
+import numpy as np  # Import numpy for numerical operations
+import os  # Import os to query the number of available CPU cores
+import time  # Import time to report progress of the parallel runs
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait  # Import process pool utilities for parallel execution
+from itertools import islice  # Import islice to take only as many events as can be started
 from bilby.core.prior import Uniform  # Import Uniform prior distribution from bilby
+import manifest  # Import the run manifest to record the state of each event
+from storage import (  # Import the storage layer
+    apply_retention_policy,
+    load_population,
+    load_posterior,
+    posterior_path,
+    save_event_summary,
+    save_posterior,
+    summary_path,
+)
+from layout import (  # Import the layout of the results directories
+    approximant_directory,
+    comparison_approximants,
+    event_label,
+    reference_frequency_candidates,
+    sweep_directory,
+    sweep_frequencies,
+)
+from detector_cache import has_reproducible_noise, interferometers_from_config  # Import the cached detector and noise setup
+from shared_data import pool_copies_data, shared_interferometer_data  # Import the sharing of the detector data with the sampler pool
+from surrogate_data import check_surrogate_data, preload_surrogates  # Import the management of the surrogate data
+from waveform_cache import cache_info, cached_lal_binary_black_hole, configure_waveform_cache_from_config  # Import the waveform cache
+from instrumentation import (  # Import the instrumentation of the pipeline stages
+    PROFILE_DIRECTORY,
+    bytes_written,
+    memory_usage,
+    profiled_call,
+    stage_timer,
+    start_memory_tracking,
+    write_metrics,
+)
+
+# Likelihood modes which can be selected with the "likelihood" key of the configuration
+LIKELIHOOD_MODES = ("standard", "relative_binning", "multiband")
+
+# Parameters of bilby.gw.source.lal_binary_black_hole, which need no conversion when they are sampled or fixed directly
+LAL_BINARY_BLACK_HOLE_PARAMETERS = frozenset((
+    "mass_1", "mass_2", "luminosity_distance", "a_1", "tilt_1", "phi_12", "a_2", "tilt_2", "phi_jl", "theta_jn",
+    "phase",
+))
+
+# Parameters which make convert_to_lal_binary_black_hole_parameters derive other parameters even if all parameters of
+# the source model are present
+_CONVERTED_PARAMETERS = frozenset(("chi_1", "chi_2", "cos_tilt_1", "cos_tilt_2", "cos_theta_jn", "delta_phase"))
+
+# Default priors of the parameters which are not set by the configuration, keyed by the configured parameter names
+_prior_templates = {}
+
+def prior_template(config):
+    """
+    Get the default binary black hole priors of the parameters which the configuration does not set.
+
+    Args:
+        config (dict): Configuration dictionary with the "parameters" section.
+
+    Returns:
+        dict: Default priors of bilby.gw.prior.BBHPriorDict without the derived mass ratio and chirp mass and without
+              the configured parameters, keyed by parameter name.
+
+    The default prior set is only built once per process and set of configured parameters; the prior objects are
+    shared by the priors of all events, which only differ in the configured parameters.
+    """
+    parameters = config.get("parameters", {})
+    key = tuple(sorted(parameters))
+    if key not in _prior_templates:
+        defaults = bilby.gw.prior.BBHPriorDict()
+
+        # Remove mass ratio and chirp mass from the priors, assuming these are derived parameters
+        del defaults["mass_ratio"]
+        del defaults["chirp_mass"]
+
+        _prior_templates[key] = {name: prior for name, prior in defaults.items() if name not in parameters}
+    return _prior_templates[key]
+
+def no_conversion(sample):
+    """
+    Conversion function of priors whose constraints need no derived parameters.
+
+    Args:
+        sample (dict): Sample of the priors.
+
+    Returns:
+        dict: The sample itself.
+    """
+    return sample
+
+def convert_lal_binary_black_hole_parameters(parameters):
+    """
+    Fast path of bilby.gw.conversion.convert_to_lal_binary_black_hole_parameters for samples which already consist of
+    the parameters of the source model.
+
+    Args:
+        parameters (dict): Parameters to convert.
+
+    Returns:
+        tuple: The converted parameters and the list of added keys, as returned by
+               convert_to_lal_binary_black_hole_parameters.
+    """
+    if LAL_BINARY_BLACK_HOLE_PARAMETERS.issubset(parameters) and _CONVERTED_PARAMETERS.isdisjoint(parameters) and \
+            not any(name.endswith("_source") for name in parameters):
+        # Nothing to derive; the generic conversion would return an unchanged copy
+        return parameters.copy(), []
+    return bilby.gw.conversion.convert_to_lal_binary_black_hole_parameters(parameters)
+
+def parameter_conversion(priors):
+    """
+    Select the parameter conversion of the waveform generator for a set of priors.
+
+    Args:
+        priors (bilby.core.prior.PriorDict): Priors of the parameter estimation.
+
+    Returns:
+        callable: convert_lal_binary_black_hole_parameters if every sampled and fixed parameter is a parameter of the
+                  source model, otherwise bilby.gw.conversion.convert_to_lal_binary_black_hole_parameters.
+    """
+    if LAL_BINARY_BLACK_HOLE_PARAMETERS.issubset(priors.keys()):
+        return convert_lal_binary_black_hole_parameters
+    return bilby.gw.conversion.convert_to_lal_binary_black_hole_parameters
 
 def create_priors(injection_parameters, config):
     """
@@ -14,14 +136,20 @@ def create_priors(injection_parameters, config):
         bilby.gw.prior.BBHPriorDict: A dictionary of priors for the Bayesian parameter estimation.
     
     The function sets up uniform priors for parameters marked for estimation in the configuration. 
-    For parameters not being estimated, it uses their injected values as fixed priors.
+    For parameters not being estimated, it uses their injected values as fixed priors. The remaining parameters keep
+    the default priors of the prior template. If no constraint prior is left, the priors skip the parameter
+    conversion which bilby otherwise applies to every sample to evaluate the constraints.
     """
-    # Initialize a dictionary of priors specific to binary black hole parameters
-    priors = bilby.gw.prior.BBHPriorDict()
-
     # Get the estimation parameters from the configuration
     parameters = config.get("parameters", {})
 
+    # Start from the default priors of the parameters the configuration does not set
+    template = prior_template(config)
+    constrained = any(isinstance(prior, bilby.core.prior.Constraint) for prior in template.values())
+    priors = bilby.gw.prior.BBHPriorDict(
+        dictionary=dict(template), conversion_function=None if constrained else no_conversion
+    )
+
     # Iterate through each parameter and set the prior based on whether it should be estimated
     for param_name, estimation_bool in parameters.items(): 
         if not estimation_bool["estimate"]:
@@ -35,120 +163,751 @@ def create_priors(injection_parameters, config):
                 name=param_name
             )
 
-    # Remove mass ratio and chirp mass from the priors, assuming these are derived parameters
-    del priors["mass_ratio"]
-    del priors["chirp_mass"]
-
-    print(priors)  # Print the created priors for debugging purposes
+    # Print the estimated parameters for debugging purposes
+    print(", ".join(f"{name}: [{priors[name].minimum:.6g}, {priors[name].maximum:.6g}]"
+                    for name, settings in parameters.items() if settings["estimate"]))
     return priors
 
-def run_parameter_estimation(config, result_directory, corner_plot=False):
+def create_waveform_generator(config, approximant, reference_frequency,
+                              source_model=bilby.gw.source.lal_binary_black_hole, frequency_range=True,
+                              conversion=bilby.gw.conversion.convert_to_lal_binary_black_hole_parameters,
+                              **extra_arguments):
     """
-    Run parameter estimation for a population of gravitational wave signals using Bayesian inference.
+    Create a frequency-domain waveform generator for the given waveform model and reference frequency.
+
+    Args:
+        config (dict): Configuration dictionary containing the duration, sampling frequency and frequency range.
+        approximant (str): The waveform model to use (e.g., "IMRPhenomPv2").
+        reference_frequency (float): Reference frequency for waveform generation.
+        source_model (callable): Frequency-domain source model of the generator. Defaults to
+                                 bilby.gw.source.lal_binary_black_hole.
+        frequency_range (bool): Whether to pass the minimum and maximum frequency to the source model. Source models
+                                evaluated on a given frequency sequence do not use them. Defaults to True.
+        conversion (callable): Parameter conversion applied before every waveform evaluation, see
+                               parameter_conversion. Defaults to
+                               bilby.gw.conversion.convert_to_lal_binary_black_hole_parameters.
+        **extra_arguments: Additional waveform arguments required by the source model.
+
+    Returns:
+        bilby.gw.WaveformGenerator: The waveform generator.
+    """
+    waveform_arguments = dict(
+        waveform_approximant=approximant,
+        reference_frequency=reference_frequency,
+        **extra_arguments
+    )
+    if frequency_range:
+        waveform_arguments["minimum_frequency"] = config['minimum_frequency']
+        waveform_arguments["maximum_frequency"] = config["maximum_frequency"]
+
+    return bilby.gw.WaveformGenerator(
+        duration=config["duration"],
+        sampling_frequency=config["sampling_frequency"],
+        frequency_domain_source_model=source_model,
+        parameter_conversion=conversion,
+        waveform_arguments=waveform_arguments,
+    )
+
+def minimum_chirp_mass(priors):
+    """
+    Compute the smallest chirp mass allowed by priors on the component masses.
+
+    Args:
+        priors (bilby.core.prior.PriorDict): Priors containing "mass_1" and "mass_2".
+
+    Returns:
+        float: The chirp mass at the lower bounds of both component masses.
+    """
+    lower_bounds = []
+    for name in ("mass_1", "mass_2"):
+        prior = priors[name]
+        # Fixed parameters are stored as plain values or delta functions
+        lower_bounds.append(getattr(prior, "minimum", prior))
+
+    return bilby.gw.conversion.component_masses_to_chirp_mass(*lower_bounds)
+
+def create_likelihood(config, ifos, approximant, reference_frequency, fiducial_parameters, priors, mode=None):
+    """
+    Create the likelihood for parameter estimation according to the likelihood mode of the configuration.
+
+    Args:
+        config (dict): Configuration dictionary. The optional key "likelihood" selects one of LIKELIHOOD_MODES and
+                       defaults to "standard"; "relative_binning_epsilon" sets the tolerance of the relative
+                       binning and defaults to 0.025.
+        ifos (bilby.gw.detector.InterferometerList): Interferometers containing the data with the injected signal.
+        approximant (str): The waveform model used for estimation.
+        reference_frequency (float): Reference frequency for waveform generation.
+        fiducial_parameters (dict): Parameters of the fiducial waveform of the relative binning, e.g. the injection
+                                    parameters, which are always known in this pipeline.
+        priors (bilby.core.prior.PriorDict): Priors of the parameter estimation.
+        mode (str, optional): Likelihood mode overriding the one of the configuration.
+
+    Returns:
+        bilby.gw.likelihood.GravitationalWaveTransient: The standard likelihood, the relative binning likelihood or
+                                                        the multi-banded likelihood.
+    """
+    mode = mode or config.get("likelihood", "standard")
+    conversion = parameter_conversion(priors)
+
+    if mode == "standard":
+        # Evaluate the full frequency-domain waveform for every likelihood call
+        waveform_generator = create_waveform_generator(config, approximant, reference_frequency, conversion=conversion)
+        return bilby.gw.GravitationalWaveTransient(
+            interferometers=ifos, waveform_generator=waveform_generator
+        )
+
+    if mode == "relative_binning":
+        # Evaluate the waveform only at the bin edges, relative to the waveform of the fiducial parameters
+        waveform_generator = create_waveform_generator(
+            config, approximant, reference_frequency,
+            source_model=bilby.gw.source.lal_binary_black_hole_relative_binning,
+            conversion=conversion,
+            fiducial=1,
+        )
+        return bilby.gw.likelihood.RelativeBinningGravitationalWaveTransient(
+            interferometers=ifos,
+            waveform_generator=waveform_generator,
+            fiducial_parameters=fiducial_parameters,
+            priors=priors,
+            epsilon=config.get("relative_binning_epsilon", 0.025),
+        )
+
+    if mode == "multiband":
+        # Evaluate the waveform on frequency bands whose resolution follows the chirp of the lightest allowed binary
+        waveform_generator = create_waveform_generator(
+            config, approximant, reference_frequency,
+            source_model=bilby.gw.source.binary_black_hole_frequency_sequence,
+            frequency_range=False,
+            conversion=conversion,
+        )
+        return bilby.gw.likelihood.MBGravitationalWaveTransient(
+            interferometers=ifos,
+            waveform_generator=waveform_generator,
+            reference_chirp_mass=minimum_chirp_mass(priors),
+        )
+
+    raise ValueError(f"Unknown likelihood mode {mode}; choose one of {', '.join(LIKELIHOOD_MODES)}.")
+
+def check_waveform(params, config, approximant, reference_frequency):
+    """
+    Generate a single waveform and check that it is valid.
+
+    Args:
+        params (dict): Parameters of the waveform.
+        config (dict): Configuration dictionary containing the duration, sampling frequency and frequency range.
+        approximant (str): The waveform model to check.
+        reference_frequency (float): Reference frequency for waveform generation.
+
+    Returns:
+        None.
+
+    Raises:
+        ValueError: If the waveform could not be generated or is not finite. Errors of the waveform model itself are
+                    raised as they are.
+    """
+    # The cached source model lets the injection reuse the waveform generated here
+    waveform_generator = create_waveform_generator(
+        config, approximant, reference_frequency, source_model=cached_lal_binary_black_hole
+    )
+    polarizations = waveform_generator.frequency_domain_strain(params)
+    if polarizations is None or not all(
+        np.all(np.isfinite(polarization)) for polarization in polarizations.values()
+    ):
+        raise ValueError(f"{approximant} returned an invalid waveform")
+
+def find_reference_frequency(params, config, start_frequency=None, approximants=None):
+    """
+    Find the first reference frequency for which the injection and the estimation waveform can both be generated.
+
+    Args:
+        params (dict): Injection parameters of the event.
+        config (dict): Configuration dictionary containing the waveform models and reference frequency settings.
+        start_frequency (float, optional): Frequency to start from instead of "reference_frequency".
+        approximants (list, optional): Estimation approximants which must be valid besides the injection approximant.
+                                       Defaults to the "waveform_approximant_estimation" of the configuration.
+
+    Returns:
+        tuple: The first valid reference frequency (or None if no candidate is valid) and the number of candidates
+               which were tried.
+
+    Generating one waveform per model is much cheaper than a sampling run, so invalid reference frequencies are
+    rejected here instead of inside the sampler.
+    """
+    if approximants is None:
+        approximants = [config['waveform_approximant_estimation']]
+
+    attempts = 0
+    for frequency in reference_frequency_candidates(config, start_frequency=start_frequency):
+        attempts += 1
+        try:
+            for approximant in [config['waveform_approximant_injection'], *approximants]:
+                check_waveform(params, config, approximant, frequency)
+            return frequency, attempts
+        except Exception as e:
+            # If the waveform cannot be generated, try the next reference frequency
+            print(f"Error with reference frequency {frequency}: {e}")
+
+    return None, attempts
+
+def inject_signal(params, config, reference_frequency, index=None):
+    """
+    Set up the interferometers of an event and inject its signal.
+
+    Args:
+        params (dict): Injection parameters of the event, including "geocent_time".
+        config (dict): Configuration dictionary with the detector, noise and waveform settings.
+        reference_frequency (float): Reference frequency of the injected waveform.
+        index (int, optional): Index of the event in the population, from which its noise realization is derived
+                               (see detector_cache.interferometers_from_config). Defaults to None.
+
+    Returns:
+        bilby.gw.detector.InterferometerList: The interferometers containing noise and the injected signal.
+    """
+    # Create the waveform generator for the injection
+    waveform_injection = create_waveform_generator(
+        config, config['waveform_approximant_injection'], reference_frequency,
+        source_model=cached_lal_binary_black_hole
+    )
+
+    # Set up the noisy interferometers and inject the signal
+    ifos = interferometers_from_config(config, index)
+    ifos.inject_signal(
+        waveform_generator=waveform_injection, parameters=params
+    )
+    return ifos
+
+def summarize_result(result, credible_level=0.9):
+    """
+    Summarize the result of a sampler run in a flat dictionary.
+
+    Args:
+        result (bilby.core.result.Result): Result of the sampler.
+        credible_level (float): Probability contained in the central credible interval. Defaults to 0.9.
+
+    Returns:
+        dict: The evidence, the Bayes factor, the numbers of posterior samples, nested samples and likelihood
+              evaluations and the sampling time in seconds, and for each sampled parameter the mean, median,
+              standard deviation and the bounds of the credible interval ("<name>_mean", "<name>_median",
+              "<name>_std", "<name>_lower", "<name>_upper").
+    """
+    sampling_time = result.sampling_time
+    summary = {
+        "log_evidence": float(result.log_evidence),
+        "log_evidence_err": float(result.log_evidence_err),
+        "log_bayes_factor": float(result.log_bayes_factor),
+        "num_samples": len(result.posterior),
+        "num_nested_samples": len(result.nested_samples) if result.nested_samples is not None else None,
+        "likelihood_evaluations": result.num_likelihood_evaluations,
+        "sampling_time": sampling_time.total_seconds() if hasattr(sampling_time, "total_seconds") else sampling_time,
+    }
+
+    tail = (1 - credible_level) / 2
+    for name in result.search_parameter_keys:
+        samples = result.posterior[name].to_numpy()
+        lower, median, upper = np.quantile(samples, [tail, 0.5, 1 - tail])
+        summary.update({
+            f"{name}_mean": float(np.mean(samples)), f"{name}_median": float(median),
+            f"{name}_std": float(np.std(samples)), f"{name}_lower": float(lower), f"{name}_upper": float(upper),
+        })
+    return summary
+
+def sample_event(index, params, priors, ifos, reference_frequency, config, result_directory, metrics, npool=1,
+                 resume=False, corner_plot=False, meta_data=None):
+    """
+    Run the sampler of an event on data which already contains its signal and save the posterior.
 
     Args:
+        index (int): Index of the event in the population, used to label the output files.
+        params (dict): Injection parameters of the event.
+        priors (bilby.gw.prior.BBHPriorDict): Priors of the event.
+        ifos (bilby.gw.detector.InterferometerList): Interferometers containing the data with the injected signal.
+        reference_frequency (float): Reference frequency of the estimation waveform.
+        config (dict): Configuration dictionary.
+        result_directory (str): Directory where the results of the parameter estimation will be saved.
+        metrics (dict): Metrics of the event; the likelihood_setup, sampling and io stages, the shared bytes, the
+                        likelihood evaluations, the size of the thinned posterior and the time to load it are added
+                        to it.
+        npool (int): Number of cores used by the sampler. Defaults to 1.
+        resume (bool): Whether to resume the sampler from an existing dynesty checkpoint. Defaults to False.
+        corner_plot (bool): Whether to create a corner plot. Defaults to False.
+        meta_data (dict, optional): Additional meta data stored in the result.
+
+    Returns:
+        bilby.core.result.Result: The result of the sampler.
+
+    The results are kept according to the optional "retention" section of the configuration: the thinned posterior
+    (at most "posterior_samples" samples, stored as "posterior_dtype", double precision by default) and a summary of the
+    result are always saved. The full result file ("full_results") and the remaining sampler files
+    ("sampler_internals", e.g. the checkpoints) are kept, compressed or dropped (the default) afterwards.
+    """
+    label = event_label(index)
+    retention = config.get("retention", {})
+
+    with stage_timer(metrics, "likelihood_setup"):
+        # Define the likelihood function for parameter estimation, using the injection as fiducial parameters
+        likelihood = create_likelihood(
+            config, ifos, config['waveform_approximant_estimation'], reference_frequency,
+            fiducial_parameters=params, priors=priors,
+        )
+
+    # Run the sampler to perform Bayesian parameter estimation, optionally under a profiler. With several cores the
+    # detector data is placed in shared memory, so that the workers of the sampler pool attach to one copy instead
+    # of each receiving their own; forked workers already share the data of this process.
+    share_data = npool > 1 and config.get("share_detector_data", True) and pool_copies_data()
+    with stage_timer(metrics, "sampling"), shared_interferometer_data(ifos, enabled=share_data) as shared:
+        metrics["shared_bytes"] = shared
+        result = profiled_call(
+            config.get("sampler_profiler"),
+            os.path.join(result_directory, PROFILE_DIRECTORY, label),
+            bilby.run_sampler,
+            likelihood=likelihood,
+            priors=priors,
+            sampler="dynesty",
+            npoints=config["npoints"],
+            npool=npool,
+            injection_parameters=params,
+            outdir=result_directory,
+            label=label,  # Unique label so that events do not overwrite each other's results
+            # Record the reference frequency used in the result
+            meta_data={"reference_frequency": reference_frequency, **(meta_data or {})},
+            resume=resume
+        )
+    metrics["likelihood_evaluations"] = result.num_likelihood_evaluations
+
+    with stage_timer(metrics, "io"):
+        # Save a thinned columnar copy of the posterior for fast loading during the analysis, and its summary
+        path = save_posterior(result_directory, index, result.posterior, num_samples=config.get("posterior_samples"),
+                              dtype=retention.get("posterior_dtype"))
+        save_event_summary(result_directory, index, summarize_result(result, config.get("credible_level", 0.9)))
+
+        # Generate a corner plot to visualize the results of the parameter estimation
+        if corner_plot:
+            result.plot_corner(filename=f"{result_directory}/corner_plot_event_{index}.png")
+
+        # Record the bytes written for the event before the retention policy removes some of them
+        metrics["bytes_written"] = bytes_written(
+            result_directory, label, [path, summary_path(result_directory, index)]
+        )
+
+        # Keep, compress or drop the full result and the files of the sampler
+        apply_retention_policy(result_directory, label, full_results=retention.get("full_results", "drop"),
+                               sampler_internals=retention.get("sampler_internals", "drop"))
+
+    # Record the size of the retained posterior and how long the analysis takes to load it
+    start_time = time.perf_counter()
+    load_posterior(result_directory, index)
+    metrics["posterior_load_time"] = time.perf_counter() - start_time
+    metrics["posterior_bytes"] = os.path.getsize(path)
+
+    return result
+
+def run_single_event(index, params, config, result_directory, corner_plot=False, npool=1, resume=False):
+    """
+    Run parameter estimation for a single event of the population.
+
+    Args:
+        index (int): Index of the event in the population, used to label the output files.
+        params (dict): Injection parameters of the event.
         config (dict): Configuration dictionary containing settings for parameter estimation, such as waveform arguments,
                        detector setup, and frequency settings.
         result_directory (str): Directory where the results of the parameter estimation will be saved.
+        corner_plot (bool): flag to create corner plot defaults to False
+        npool (int): Number of cores used by the sampler for this event. Defaults to 1. With more than one core the
+                     detector data is shared with the workers of the sampler through shared memory, unless the
+                     configuration sets "share_detector_data" to False or the workers are forked.
+        resume (bool): Whether to resume the sampler from an existing dynesty checkpoint of this event. Only valid
+                       if the noise of the event is reproducible (see detector_cache.has_reproducible_noise), so that
+                       the checkpoint belongs to the same data. Defaults to False.
+
+    Returns:
+        dict: Summary of the run with the keys "event" (int), "success" (bool), "reference_frequency" (float or
+              None), the reference frequency passed to the sampler, and "attempts" (int), the number of reference
+              frequencies tried before a valid one was found.
+
+    The wall time of each stage (setup, preflight, injection, likelihood_setup, sampling, io), the number of
+    likelihood evaluations, the retries, the memory high-water marks of the event and of its sampler processes, the
+    bytes written (before the retention policy) and retained, and the waveform cache counters of the event are written to metrics/<label>.json in the results directory. If the configuration sets
+    "sampler_profiler" to "cprofile" or "py-spy", the sampler call is profiled into profiles/<label>.
+    """
+    label = event_label(index)
+    metrics = {"event": index, "success": False, "reference_frequency": None, "attempts": 0, "retries": 0}
+    start_time = time.perf_counter()
+    memory_tracking = start_memory_tracking()
+
+    try:
+        with stage_timer(metrics, "setup"):
+            # Set the geocentric time for the event on a copy, as the caller's parameters are its true values
+            params = {**params, "geocent_time": config["geocent_time"]}
+
+            # Create priors for the parameters of the current event
+            priors = create_priors(params, config)
+            priors["geocent_time"] = config["geocent_time"]
+
+            configure_waveform_cache_from_config(config)
+
+        # Find a reference frequency for which both waveform models can be generated before starting the sampler
+        with stage_timer(metrics, "preflight"):
+            frequency, attempts = find_reference_frequency(params, config)
+        metrics.update(reference_frequency=frequency, attempts=attempts, retries=max(attempts - 1, 0))
+
+        if frequency is None:
+            print(f"Failed to run parameter estimation for event {index}: no valid reference frequency found "
+                  f"after {attempts} attempts.")
+            return {"event": index, "success": False, "reference_frequency": None, "attempts": attempts}
+
+        try:
+            with stage_timer(metrics, "injection"):
+                ifos = inject_signal(params, config, frequency, index)
+
+            sample_event(index, params, priors, ifos, frequency, config, result_directory, metrics, npool=npool,
+                         resume=resume, corner_plot=corner_plot)
+            metrics["success"] = True  # If no error occurs, the estimation was successful
+
+        except Exception as e:
+            # A valid reference frequency was found beforehand, so a failure here is not retried at another frequency
+            print(f"Failed to run parameter estimation for event {index} with reference frequency {frequency}: {e}")
+            metrics["error"] = str(e)
+
+        return {"event": index, "success": metrics["success"], "reference_frequency": frequency, "attempts": attempts}
+
+    finally:
+        # Write the timing and resource metrics of the event, whether it succeeded or not
+        metrics["sampler_wall_time"] = metrics.get("stages", {}).get("sampling")
+        metrics["wall_time"] = time.perf_counter() - start_time
+        metrics.update(memory_usage(memory_tracking))
+        metrics["bytes_retained"] = bytes_written(
+            result_directory, label, [posterior_path(result_directory, index), summary_path(result_directory, index)]
+        )
+        metrics.setdefault("bytes_written", metrics["bytes_retained"])
+        metrics["waveform_cache"] = cache_info()
+        write_metrics(result_directory, label, metrics)
+
+def run_parameter_estimation(config, result_directory, corner_plot=False, retry_failed=False, on_event_done=None,
+                             events=None):
+    """
+    Run parameter estimation for a population of gravitational wave signals using Bayesian inference.
+
+    Args:
+        config (dict): Configuration dictionary containing settings for parameter estimation, such as waveform arguments,
+                       detector setup, and frequency settings. The optional keys "num_workers" (number of events run
+                       concurrently) and "cores_per_sampler" (number of cores used by each sampler) control the
+                       parallel execution; both default to 1, which runs the events one after another.
+        result_directory (str): Directory where the results of the parameter estimation will be saved.
         corner_plot(bool): flag to create corner plot defaults to False
+        retry_failed(bool): flag to run events again which failed in a previous run of the same results directory,
+                            defaults to False
+        on_event_done(callable): optional function called in the main process with the summary and the injection
+                                 parameters of each event as soon as the event has finished, defaults to None
+        events(iterable): optional (index, injection parameters) pairs of the events to run, e.g. a generator which
+                          produces the population while the first events are already running; the configuration
+                          key "num_events" then gives the size of the population. Defaults to the population saved
+                          in the results directory.
 
     Returns:
-        None. Saves the results of the parameter estimation to the specified directory and generates corner plots.
+        list: One summary dictionary per event run by this call as returned by run_single_event, ordered by event index.
+              The results of each event are saved to the specified directory under the label given by event_label.
     
     This function reads the population of injection parameters, adjusts the reference frequency if necessary, and 
     performs Bayesian parameter estimation using bilby's built-in sampler and likelihood functions.
+
+    The state of each event is recorded in the run manifest of the results directory. Events which are already done
+    (and failed events unless retry_failed is set) are skipped, and events which were interrupted while running are
+    resumed from their dynesty checkpoint, so that calling this function again on the same directory continues the run.
+    Resuming requires the noise of each event to be reproducible ("noise_seed" or "noise_run_seed", which main sets
+    for new runs); otherwise interrupted events start again from scratch.
+
+    At most "max_in_flight_events" events (defaults to twice "num_workers") are submitted to the worker pool at a time.
+    Further events are only taken from events once one of them has finished, so a lazy iterable is consumed at the
+    pace of the samplers.
+
+    The data files of surrogate approximants (e.g. NRSur7dq4) are checked before the first event starts and loaded
+    once per process, see surrogate_data.
+    """
+    # Stop at once if the data of a surrogate approximant is missing, rather than failing every event
+    check_surrogate_data(config)
+
+    if events is None:
+        # Load the population parameters from the population file
+        population_parameters = load_population(result_directory, config)
+        events, num_events = enumerate(population_parameters), len(population_parameters)
+    else:
+        num_events = config["num_events"]
+
+    # Split the available cores between concurrently running events and the cores used by each sampler
+    num_workers = config.get("num_workers", 1)
+    cores_per_sampler = config.get("cores_per_sampler", 1)
+
+    # Load the manifest of a previous run, or start a new one in which every event is pending
+    run_manifest = manifest.load_manifest(result_directory)
+    if run_manifest is None:
+        run_manifest = manifest.create_manifest(result_directory, num_events)
+
+    # Select the events which still have to be run
+    skipped_states = {manifest.DONE} if retry_failed else {manifest.DONE, manifest.FAILED}
+    num_pending = sum(manifest.event_state(run_manifest, i) not in skipped_states for i in range(num_events))
+    pending_events = (
+        (i, params) for i, params in events if manifest.event_state(run_manifest, i) not in skipped_states
+    )
+    if num_pending < num_events:
+        print(f"Skipping {num_events - num_pending} events which are already finished.")
+
+    def event_kwargs(i):
+        # Interrupted events restart from their checkpoint, unless their noise cannot be built again, in which case
+        # the live points of the checkpoint belong to different data and the event starts from scratch
+        interrupted = manifest.event_state(run_manifest, i) == manifest.RUNNING
+        if interrupted and not has_reproducible_noise(config):
+            print(f"Restarting event {i} from scratch: without noise_seed or noise_run_seed its data cannot be "
+                  f"rebuilt for its checkpoint.")
+        return dict(corner_plot=corner_plot, npool=cores_per_sampler,
+                    resume=interrupted and has_reproducible_noise(config))
+
+    def record(summary, params):
+        state = manifest.DONE if summary["success"] else manifest.FAILED
+        manifest.update_event(result_directory, run_manifest, summary["event"], state,
+                              reference_frequency=summary["reference_frequency"])
+        if on_event_done is not None:
+            on_event_done(summary, params)
+
+    if num_workers * cores_per_sampler > (os.cpu_count() or 1):
+        print(f"Warning: {num_workers} workers x {cores_per_sampler} cores per sampler exceeds the "
+              f"{os.cpu_count()} available cores.")
+
+    # Load the surrogate data once; worker processes forked from this process share it
+    preload_surrogates(config)
+
+    # Run the events one after another in the current process
+    if num_workers <= 1:
+        summaries = []
+        for i, params in pending_events:
+            kwargs = event_kwargs(i)
+            manifest.update_event(result_directory, run_manifest, i, manifest.RUNNING)
+            summary = run_single_event(i, params, config, result_directory, **kwargs)
+            record(summary, params)
+            summaries.append(summary)
+        return summaries
+
+    # Otherwise distribute the events over a pool of worker processes
+    max_in_flight = max(config.get("max_in_flight_events") or 2 * num_workers, num_workers)
+    print(f"Running parameter estimation for {num_pending} events on {num_workers} workers "
+          f"with {cores_per_sampler} cores per sampler...")
+    summaries = []
+    completed = 0
+    start_time = time.time()
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=preload_surrogates, initargs=(config,)) as executor:
+        futures = {}
+        while True:
+            # Top up the pool to the bound on in-flight events; the next events are only drawn once a slot is free
+            for i, params in islice(pending_events, max_in_flight - len(futures)):
+                kwargs = event_kwargs(i)
+                futures[executor.submit(run_single_event, i, params, config, result_directory, **kwargs)] = (i, params)
+                manifest.update_event(result_directory, run_manifest, i, manifest.RUNNING)
+            if not futures:
+                break
+
+            # Collect the result of each event as soon as it has finished
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                i, params = futures.pop(future)
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    # An error outside of the reference frequency loop (e.g. a crashed worker) fails only this event
+                    print(f"Parameter estimation for event {i} failed in its worker process: {e}")
+                    summary = {"event": i, "success": False, "reference_frequency": None, "attempts": 0}
+                record(summary, params)
+                summaries.append(summary)
+
+                completed += 1
+                status = "done" if summary["success"] else "failed"
+                elapsed = time.time() - start_time
+                print(f"[{completed}/{num_pending}] Event {i} {status} after {elapsed:.1f} s")
+
+    return sorted(summaries, key=lambda summary: summary["event"])
+
+def run_shared_data_event(index, params, ifos, directory, approximant, reference_frequency, injection_frequency,
+                          config, npool=1):
+    """
+    Run parameter estimation for a single event on detector data shared with other runs of the same event.
+
+    Args:
+        index (int): Index of the event in the population.
+        params (dict): Injection parameters of the event, including "geocent_time".
+        ifos (bilby.gw.detector.InterferometerList): Interferometers containing the injected signal, shared by all
+                                                     runs of the event.
+        directory (str): Directory where the results of this run are saved.
+        approximant (str): Waveform approximant used for estimation.
+        reference_frequency (float): Reference frequency of the estimation waveform.
+        injection_frequency (float): Reference frequency at which the signal was injected.
+        config (dict): Configuration dictionary.
+        npool (int): Number of cores used by the sampler. Defaults to 1.
+
+    Returns:
+        dict: Summary of the run with the keys "event", "success", "approximant" and "reference_frequency".
+    """
+    label = event_label(index)
+    config = {**config, "waveform_approximant_estimation": approximant}
+    metrics = {"event": index, "success": False, "approximant": approximant,
+               "reference_frequency": reference_frequency, "injection_frequency": injection_frequency}
+    start_time = time.perf_counter()
+    memory_tracking = start_memory_tracking()
+
+    try:
+        with stage_timer(metrics, "setup"):
+            priors = create_priors(params, config)
+            priors["geocent_time"] = config["geocent_time"]
+            configure_waveform_cache_from_config(config)
+
+        with stage_timer(metrics, "preflight"):
+            check_waveform(params, config, approximant, reference_frequency)
+
+        sample_event(index, params, priors, ifos, reference_frequency, config, directory, metrics, npool=npool,
+                     meta_data={"approximant": approximant, "injection_frequency": injection_frequency})
+        metrics["success"] = True
+
+    except Exception as e:
+        print(f"Failed to run parameter estimation for event {index} with {approximant} at reference frequency "
+              f"{reference_frequency}: {e}")
+        metrics["error"] = str(e)
+
+    finally:
+        metrics["wall_time"] = time.perf_counter() - start_time
+        metrics.update(memory_usage(memory_tracking))
+        metrics["bytes_retained"] = bytes_written(
+            directory, label, [posterior_path(directory, index), summary_path(directory, index)]
+        )
+        metrics.setdefault("bytes_written", metrics["bytes_retained"])
+        write_metrics(directory, label, metrics)
+
+    return {"event": index, "success": metrics["success"], "approximant": approximant,
+            "reference_frequency": reference_frequency}
+
+def run_shared_injections(config, result_directory, variants, approximants):
+    """
+    Run several estimation variants of every event of the population on a single injection per event.
+
+    Args:
+        config (dict): Configuration dictionary; the keys "num_workers", "cores_per_sampler" and
+                       "max_in_flight_events" are used as in run_parameter_estimation.
+        result_directory (str): Directory where the population is stored.
+        variants (list): (results directory, estimation approximant, reference frequency) of each variant. A
+                         reference frequency of None uses the reference frequency of the injection.
+        approximants (list): Approximants which, together with the injection approximant, must be valid at the
+                             reference frequency of the injection.
+
+    Returns:
+        list: One summary dictionary per run as returned by run_shared_data_event, ordered by event.
+
+    The signal of each event is injected once, at the first reference frequency at which the injection and all given
+    approximants can be generated (see find_reference_frequency), and the same detector data is analysed by every
+    variant, so that differences between the variants are not masked by different noise realisations. The runs of
+    all variants are independent and are spread over the worker pool. Runs which already have a posterior are
+    skipped, so calling this function again continues an interrupted run. The data of surrogate approximants is
+    checked and loaded as in run_parameter_estimation.
+    """
+    check_surrogate_data(config)
+    preload_surrogates(config)
+
+    population_parameters = load_population(result_directory, config)
+    num_workers = config.get("num_workers", 1)
+    cores_per_sampler = config.get("cores_per_sampler", 1)
+    max_in_flight = max(config.get("max_in_flight_events") or 2 * num_workers, num_workers)
+
+    def shared_runs():
+        # Inject each event once and hand out one run per variant which has no result yet
+        for i, params in enumerate(population_parameters):
+            pending = [variant for variant in variants if not os.path.exists(posterior_path(variant[0], i))]
+            if not pending:
+                continue
+
+            params = {**params, "geocent_time": config["geocent_time"]}
+            configure_waveform_cache_from_config(config)
+            injection_frequency, attempts = find_reference_frequency(params, config, approximants=approximants)
+            if injection_frequency is None:
+                print(f"Skipping event {i}: no valid reference frequency found after {attempts} attempts.")
+                continue
+
+            ifos = inject_signal(params, config, injection_frequency, i)
+            for directory, approximant, frequency in pending:
+                yield (i, params, ifos, directory, approximant,
+                       frequency if frequency is not None else injection_frequency, injection_frequency)
+
+    summaries = []
+    start_time = time.time()
+
+    def record(summary):
+        summaries.append(summary)
+        status = "done" if summary["success"] else "failed"
+        print(f"[{len(summaries)}] Event {summary['event']} with {summary['approximant']} at "
+              f"{summary['reference_frequency']:g} Hz {status} after {time.time() - start_time:.1f} s")
+
+    # Run one run after another in the current process
+    if num_workers <= 1:
+        for run in shared_runs():
+            record(run_shared_data_event(*run, config, npool=cores_per_sampler))
+        return sorted(summaries, key=lambda summary: summary["event"])
+
+    # Otherwise distribute the runs over a pool of worker processes, injecting further events only when a slot is free
+    runs = shared_runs()
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=preload_surrogates, initargs=(config,)) as executor:
+        futures = {}
+        while True:
+            for run in islice(runs, max_in_flight - len(futures)):
+                futures[executor.submit(run_shared_data_event, *run, config, npool=cores_per_sampler)] = run
+            if not futures:
+                break
+
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                i, _, _, _, approximant, frequency, _ = futures.pop(future)
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    print(f"Parameter estimation for event {i} with {approximant} failed in its worker process: {e}")
+                    summary = {"event": i, "success": False, "approximant": approximant,
+                               "reference_frequency": frequency}
+                record(summary)
+
+    return sorted(summaries, key=lambda summary: summary["event"])
+
+def run_reference_frequency_sweep(config, result_directory):
+    """
+    Run parameter estimation for every event of the population at each reference frequency of a sweep.
+
+    Args:
+        config (dict): Configuration dictionary. The reference frequencies are given by sweep_frequencies.
+        result_directory (str): Directory where the population is stored; the results of each reference frequency
+                                are saved to sweep_directory.
+
+    Returns:
+        list: One summary dictionary per run as returned by run_shared_data_event.
+
+    The signal of each event is injected once, at the reference frequency the regular pipeline would use, and the
+    same detector data is analysed at every reference frequency of the sweep (see run_shared_injections).
+    """
+    frequencies = sweep_frequencies(config)
+    print(f"Sweeping the reference frequencies {', '.join(f'{frequency:g}' for frequency in frequencies)} Hz...")
+    approximant = config["waveform_approximant_estimation"]
+    variants = [(sweep_directory(result_directory, frequency), approximant, frequency) for frequency in frequencies]
+    return run_shared_injections(config, result_directory, variants, approximants=[approximant])
+
+def run_approximant_comparison(config, result_directory):
+    """
+    Run parameter estimation for every event of the population with each estimation approximant of a comparison.
+
+    Args:
+        config (dict): Configuration dictionary. The estimation approximants are given by comparison_approximants.
+        result_directory (str): Directory where the population is stored; the results of each approximant are saved
+                                to approximant_directory.
+
+    Returns:
+        list: One summary dictionary per run as returned by run_shared_data_event.
+
+    The signal of each event is injected once into detector data shared by all approximants, at the first
+    reference frequency at which every approximant can be generated, and each approximant is estimated at that
+    reference frequency (see run_shared_injections).
     """
-    # Load the population parameters from the specified JSON file
-    with open(f"{result_directory}/{config['population_file']}", 'r') as f:
-        population_parameters = json.load(f)
-
-    # Initialize the reference frequency to start the estimation
-    initial_frequency = config["reference_frequency"]
-
-    # Iterate over each set of population parameters
-    for i, params in enumerate(population_parameters):
-        # Set the geocentric time for each event
-        params["geocent_time"] = config["geocent_time"]
-
-        # Create priors for the parameters of the current event
-        priors = create_priors(params, config)
-        priors["geocent_time"] = config["geocent_time"]
-
-        success = False  # Flag to track successful estimation
-        frequency = initial_frequency  # Start with the initial reference frequency
-
-        # Try different reference frequencies until the parameter estimation is successful or the max frequency is reached
-        while not success and frequency <= config["max_reference_frequency"]:
-            try:
-                # Define waveform arguments for signal injection and parameter estimation
-                waveform_arguments_injection = dict(
-                    waveform_approximant=config['waveform_approximant_injection'],
-                    reference_frequency=frequency,
-                    minimum_frequency=config['minimum_frequency'],
-                    maximum_frequency=config["maximum_frequency"],
-                )
-
-                waveform_arguments_estimation = dict(
-                    waveform_approximant=config['waveform_approximant_estimation'],
-                    reference_frequency=frequency,
-                    minimum_frequency=config['minimum_frequency'],
-                    maximum_frequency=config["maximum_frequency"],
-                )
-
-                # Create waveform generators for injection and estimation
-                waveform_injection = bilby.gw.WaveformGenerator(
-                    duration=config["duration"],
-                    sampling_frequency=config["sampling_frequency"],
-                    frequency_domain_source_model=bilby.gw.source.lal_binary_black_hole,
-                    parameter_conversion=bilby.gw.conversion.convert_to_lal_binary_black_hole_parameters,
-                    waveform_arguments=waveform_arguments_injection,
-                )
-
-                waveform_estimation = bilby.gw.WaveformGenerator(
-                    duration=config["duration"],
-                    sampling_frequency=config["sampling_frequency"],
-                    frequency_domain_source_model=bilby.gw.source.lal_binary_black_hole,
-                    parameter_conversion=bilby.gw.conversion.convert_to_lal_binary_black_hole_parameters,
-                    waveform_arguments=waveform_arguments_estimation,
-                )
-
-                # Setup interferometers and inject the signal
-                ifos = bilby.gw.detector.InterferometerList(config["detector_setup"])
-                ifos.set_strain_data_from_power_spectral_densities(
-                    sampling_frequency=config["sampling_frequency"],
-                    duration=config["duration"],
-                    start_time=config["geocent_time"] - 2,
-                )
-                ifos.inject_signal(
-                    waveform_generator=waveform_injection, parameters=params
-                )
-
-                # Define the likelihood function for parameter estimation
-                likelihood = bilby.gw.GravitationalWaveTransient(
-                    interferometers=ifos, waveform_generator=waveform_estimation
-                )
-
-                # Run the sampler to perform Bayesian parameter estimation
-                result = bilby.run_sampler(
-                    likelihood=likelihood,
-                    priors=priors,
-                    sampler="dynesty",
-                    npoints=config["npoints"],
-                    injection_parameters=params,
-                    outdir=result_directory,
-                    resume=False
-                )
-
-                # Generate a corner plot to visualize the results of the parameter estimation
-                if corner_plot:
-                    result.plot_corner(filename=f"{result_directory}/corner_plot_event_{i}.png")
-                success = True  # If no error occurs, set success to True
-
-            except Exception as e:
-                # If an error occurs, print the error and try the next reference frequency
-                print(f"Error with reference frequency {frequency}: {e}")
-                frequency += config["frequency_increment"]  # Increment the frequency and try again
-
-        # If no successful estimation is achieved after all attempts
-        if not success:
-            print(f"Failed to run parameter estimation for event {i} even after adjusting the reference frequency.")
\ No newline at end of file
+    approximants = comparison_approximants(config)
+    print(f"Comparing the estimation approximants {', '.join(approximants)}...")
+    variants = [(approximant_directory(result_directory, approximant), approximant, None)
+                for approximant in approximants]
+    return run_shared_injections(config, result_directory, variants, approximants=approximants)
@@ -0,0 +1,178 @@
+import multiprocessing  # Import multiprocessing to find the start method of the sampler pools
+from contextlib import contextmanager  # Import contextmanager to release the shared memory with a with statement
+from multiprocessing import shared_memory  # Import shared_memory to place the detector data in shared memory
+import numpy as np  # Import numpy for numerical operations
+
+# Shared memory segments created by this process, keyed by their name
+_created_segments = {}
+
+# Shared memory segments attached by this process (e.g. a worker of the sampler pool), keyed by their name. They stay
+# attached for the lifetime of the process, as the arrays unpickled from them are views into the segments.
+_attached_segments = {}
+
+class SharedArray(np.ndarray):
+    """
+    Read-only array stored in a shared memory segment.
+
+    Pickling an array whose segment is alive only transfers the name of the segment; the receiving process attaches
+    to the segment and gets a read-only view of the same memory instead of a copy. Arrays derived from it (slices,
+    results of arithmetic) and arrays whose segment has been released are pickled as ordinary arrays.
+    """
+
+    def __array_finalize__(self, obj):
+        # Only the array created by share_array refers to the whole segment
+        self._segment_name = None
+
+    def __reduce__(self):
+        if self._segment_name in _created_segments:
+            return _attach_array, (self._segment_name, self.shape, self.dtype.str)
+        return np.asarray(self).__reduce__()
+
+def _attach_array(name, shape, dtype):
+    # Unpickle a SharedArray by attaching to its segment, once per process and segment
+    if name in _created_segments:
+        # Unpickled by the process owning the segment, which may release it while the copy is still in use
+        return np.ndarray(shape, dtype=dtype, buffer=_created_segments[name].buf).copy()
+
+    segment = _attached_segments.get(name)
+    if segment is None:
+        segment = shared_memory.SharedMemory(name=name)
+        _attached_segments[name] = segment
+
+    array = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+    array.flags.writeable = False
+    return array
+
+def share_array(array):
+    """
+    Copy an array into a new shared memory segment.
+
+    Args:
+        array (numpy.ndarray): Array to share.
+
+    Returns:
+        SharedArray: Read-only copy of the array in shared memory. The segment stays allocated until it is released
+                     with release_array.
+    """
+    array = np.ascontiguousarray(array)
+    segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    _created_segments[segment.name] = segment
+
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf).view(SharedArray)
+    shared[...] = array
+    shared._segment_name = segment.name
+    shared.flags.writeable = False
+    return shared
+
+def release_array(shared):
+    """
+    Free the shared memory segment of an array created by share_array.
+
+    Args:
+        shared (SharedArray): Array returned by share_array. It must not be used afterwards.
+
+    Returns:
+        None.
+    """
+    segment = _created_segments.pop(shared._segment_name, None)
+    if segment is None:
+        return
+
+    try:
+        segment.close()
+    except BufferError:
+        # Views of the segment are still referenced somewhere; the memory is freed once they are garbage collected
+        pass
+    segment.unlink()
+
+def pool_copies_data():
+    """
+    Check whether the workers of a multiprocessing pool receive their own copy of the data passed to them.
+
+    Returns:
+        bool: True unless pools use the fork start method, whose workers share the memory of the parent process
+              copy-on-write, so that placing the data in shared memory brings no benefit.
+    """
+    return multiprocessing.get_start_method() != "fork"
+
+def _interferometer_arrays(interferometer):
+    # Containers and keys of the read-only arrays of an interferometer: the frequency-domain strain, the frequency
+    # array and frequency mask of the data, the power and amplitude spectral densities evaluated on the frequency
+    # array, and the spectral density as read from file together with its interpolant. Most of them are private
+    # attributes of bilby, so their presence is checked; an AttributeError is raised if bilby stores them elsewhere.
+    strain_data = interferometer.strain_data
+    strain_data.frequency_mask  # Compute the mask before sharing it
+    interferometer.power_spectral_density_array  # Evaluate the PSD on the frequency array of the data
+    psd = interferometer.power_spectral_density
+
+    times_and_frequencies = getattr(strain_data, "_times_and_frequencies", None)
+    expected = [
+        (vars(strain_data), ("_frequency_domain_strain", "_frequency_mask", "_time_domain_strain")),
+        (vars(times_and_frequencies) if times_and_frequencies is not None else {}, ("_frequency_array", "_time_array")),
+        (getattr(psd, "_cache", {}), ("frequency_array", "psd_array", "asd_array")),
+        (vars(psd), ("frequency_array", "_PowerSpectralDensity__psd_array", "_PowerSpectralDensity__asd_array")),
+    ]
+    missing = [key for container, keys in expected for key in keys if key not in container]
+    if missing:
+        raise AttributeError(f"bilby no longer stores the detector data in {', '.join(missing)}")
+
+    locations = [(container, key) for container, keys in expected for key in keys]
+    # The attributes of the interpolant differ between scipy versions, so only those present are shared
+    locations.extend((vars(psd.power_spectral_density_interpolated), key) for key in ("x", "y", "_y"))
+    return [(container, key) for container, key in locations if isinstance(container.get(key), np.ndarray)]
+
+@contextmanager
+def shared_interferometer_data(interferometers, enabled=True):
+    """
+    Place the data of the interferometers in shared memory while the context is active.
+
+    Args:
+        interferometers (bilby.gw.detector.InterferometerList): Interferometers whose data is shared, e.g. the
+                                                                interferometers of the likelihood of an event.
+        enabled (bool): Whether to share the data. Defaults to True; if False the context does nothing.
+
+    Yields:
+        int: Number of bytes placed in shared memory.
+
+    The frequency-domain strain, the frequency masks and the power spectral densities of each interferometer are
+    replaced by read-only SharedArray copies, so that the likelihood pickled to the workers of a multiprocessing pool
+    only carries the names of the segments and every worker maps the same memory. The data must not be modified while
+    the context is active. On exit the interferometers get private copies of their data back and the segments are
+    freed. If the data is not found where this version of bilby is expected to store it, a warning is printed and the
+    data is pickled to the workers as usual.
+    """
+    if not enabled:
+        yield 0
+        return
+
+    try:
+        locations = [
+            location for interferometer in interferometers for location in _interferometer_arrays(interferometer)
+        ]
+    except AttributeError as e:
+        print(f"Warning: the detector data is not shared with the sampler workers: {e}.")
+        yield 0
+        return
+
+    # Share every array once, keeping arrays which are referenced from several places identical
+    shared_arrays = {}
+    try:
+        for container, key in locations:
+            array = container[key]
+            if id(array) not in shared_arrays:
+                shared_arrays[id(array)] = share_array(array)
+            container[key] = shared_arrays[id(array)]
+
+        yield sum(shared.nbytes for shared in shared_arrays.values())
+    finally:
+        # Give the interferometers private copies back before the segments are freed
+        copies = {}
+        for container, key in locations:
+            array = container[key]
+            if isinstance(array, SharedArray):
+                if id(array) not in copies:
+                    copies[id(array)] = np.array(array, subok=False)
+                container[key] = copies[id(array)]
+
+        for shared in shared_arrays.values():
+            release_array(shared)
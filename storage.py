@@ -0,0 +1,451 @@
+import glob  # Import glob to find the sampler files of an event
+import gzip  # Import gzip to compress retained sampler files
+import json  # Import json to handle JSON file operations
+import os  # Import os to handle file paths
+import shutil  # Import shutil to copy files into their compressed version
+import numpy as np  # Import numpy for numerical operations
+
+# pyarrow and pandas are imported inside the functions that need them, so that writing a JSON or CSV population does
+# not pay for importing them.
+
+# Output formats of the population file
+POPULATION_FORMATS = ("json", "csv", "arrow")
+
+# Directory inside a results directory holding one thinned posterior file per event
+POSTERIOR_DIRECTORY = "posteriors"
+
+# Directory inside a results directory holding one summary file per event
+SUMMARY_DIRECTORY = "summaries"
+
+# Name of the column identifying the event of each row in the columnar files
+EVENT_ID = "event_id"
+
+# Suffix of the GPS time columns of a posterior (geocent_time, H1_time, ...). They are always stored in double
+# precision, as float32 only resolves GPS times of about 1e9 s to a minute.
+TIME_COLUMN_SUFFIX = "time"
+
+# What the retention policy does with a kind of file: keep it, replace it by a gzip-compressed copy, or delete it
+RETENTION_MODES = ("keep", "compress", "drop")
+
+def write_table(path, chunks):
+    """
+    Write columnar data to an Arrow IPC file.
+
+    Args:
+        path (str): Path of the file to write.
+        chunks (iterable): Chunks of the table, each a dictionary mapping column names to arrays of equal length.
+                           All chunks must have the same columns.
+
+    Returns:
+        int: Number of rows written.
+
+    Every chunk is written as a separate record batch as soon as it is available, so the table never has to be held
+    in memory as a whole.
+    """
+    import pyarrow as pa
+
+    writer = None
+    num_rows = 0
+    try:
+        for chunk in chunks:
+            batch = pa.RecordBatch.from_pydict({name: np.asarray(values) for name, values in chunk.items()})
+            if writer is None:
+                writer = pa.ipc.new_file(path, batch.schema)
+            writer.write_batch(batch)
+            num_rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return num_rows
+
+def read_table(path, columns=None):
+    """
+    Read an Arrow IPC file written by write_table.
+
+    Args:
+        path (str): Path of the file to read.
+        columns (list, optional): Names of the columns to read. Defaults to all columns.
+
+    Returns:
+        pandas.DataFrame: The table. The file is memory-mapped, so only the requested columns are read from disk.
+    """
+    import pyarrow as pa
+
+    with pa.memory_map(path, 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select(columns)
+        return table.to_pandas()
+
+def chunk_to_events(chunk):
+    """
+    Convert a chunk of columnar arrays to a list with one parameter dictionary per event.
+
+    Args:
+        chunk (dict): Mapping from parameter name to an array of values.
+
+    Returns:
+        list: One dictionary per event mapping each parameter name to a float.
+    """
+    names = list(chunk.keys())
+    return [dict(zip(names, values)) for values in zip(*(np.asarray(chunk[name]).tolist() for name in names))]
+
+def population_path(result_directory, config):
+    """
+    Build the path of the population file.
+
+    Args:
+        result_directory (str): Directory where the population file is stored.
+        config (dict): Configuration dictionary with the key "population_file" and the optional key
+                       "population_format" (one of POPULATION_FORMATS, defaults to "json").
+
+    Returns:
+        str: Path of the population file; the extension of "population_file" is replaced by ".csv" or ".arrow"
+             for the CSV and Arrow formats.
+    """
+    file_name = config['population_file']
+    population_format = config.get("population_format", "json")
+    if population_format != "json":
+        file_name = f"{os.path.splitext(file_name)[0]}.{population_format}"
+    return f"{result_directory}/{file_name}"
+
+def save_population(result_directory, config, chunks, path=None):
+    """
+    Save a population to the population file.
+
+    Args:
+        result_directory (str): Directory where the population file will be saved.
+        config (dict): Configuration dictionary with the keys "population_file" and "parameters" and the optional
+                       key "population_format".
+        chunks (iterable): Chunks of the population, each a dictionary mapping parameter names to arrays.
+        path (str, optional): Path of the file to write. Defaults to population_path.
+
+    Returns:
+        str: Path of the population file.
+
+    The "csv" and "arrow" formats write each chunk as soon as it is generated; the "arrow" file additionally stores
+    the event id of each row. The "json" format keeps the original list of dictionaries for compatibility.
+    """
+    population_format = config.get("population_format", "json")
+    if path is None:
+        path = population_path(result_directory, config)
+
+    if population_format == "arrow":
+        def with_event_ids(chunks):
+            start = 0
+            for chunk in chunks:
+                size = len(next(iter(chunk.values())))
+                yield {EVENT_ID: np.arange(start, start + size), **chunk}
+                start += size
+
+        write_table(path, with_event_ids(chunks))
+    elif population_format == "csv":
+        # Write the header once and append every chunk as soon as it has been generated
+        with open(path, 'w') as f:
+            f.write(",".join(config.get("parameters", {}).keys()) + "\n")
+            for chunk in chunks:
+                np.savetxt(f, np.column_stack(list(chunk.values())), delimiter=",", fmt="%.17g")
+    elif population_format == "json":
+        population_parameters = []
+        for chunk in chunks:
+            population_parameters.extend(chunk_to_events(chunk))
+
+        # Save the generated population to a JSON file
+        with open(path, 'w') as f:
+            json.dump(population_parameters, f, indent=4)
+    else:
+        raise ValueError(f"Unknown population format {population_format}; choose one of {', '.join(POPULATION_FORMATS)}.")
+
+    return path
+
+def load_population_table(result_directory, config):
+    """
+    Load the population as a table.
+
+    Args:
+        result_directory (str): Directory where the population file is stored.
+        config (dict): Configuration dictionary with the key "population_file" and the optional key
+                       "population_format".
+
+    Returns:
+        pandas.DataFrame: One row per event and one column per parameter, indexed by event id.
+    """
+    import pandas as pd
+
+    path = population_path(result_directory, config)
+    population_format = config.get("population_format", "json")
+
+    if population_format == "arrow":
+        table = read_table(path)
+    elif population_format == "csv":
+        table = pd.read_csv(path)
+    else:
+        with open(path, 'r') as f:
+            table = pd.DataFrame(json.load(f))
+
+    if EVENT_ID not in table.columns:
+        table[EVENT_ID] = np.arange(len(table))
+    return table.set_index(EVENT_ID)
+
+def load_population(result_directory, config):
+    """
+    Load the population generated by generate_population.
+
+    Args:
+        result_directory (str): Directory where the population file is stored.
+        config (dict): Configuration dictionary with the key "population_file" and the optional key
+                       "population_format".
+
+    Returns:
+        list: One dictionary of injection parameters per event, ordered by event id.
+    """
+    if config.get("population_format", "json") == "json":
+        with open(population_path(result_directory, config), 'r') as f:
+            return json.load(f)
+
+    table = load_population_table(result_directory, config).sort_index()
+    return chunk_to_events({name: table[name].to_numpy() for name in table.columns})
+
+def posterior_path(result_directory, event_id):
+    """
+    Build the path of the thinned posterior file of an event.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+        event_id (int): Index of the event in the population.
+
+    Returns:
+        str: Path of the posterior file.
+    """
+    return os.path.join(result_directory, POSTERIOR_DIRECTORY, f"event_{event_id}.arrow")
+
+def save_posterior(result_directory, event_id, posterior, num_samples=None, dtype=None):
+    """
+    Save a thinned copy of the numeric columns of a posterior.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+        event_id (int): Index of the event in the population.
+        posterior (pandas.DataFrame): Posterior samples, e.g. the posterior of a bilby result.
+        num_samples (int, optional): Maximum number of samples to keep; evenly spaced samples are kept if the
+                                     posterior is longer. Defaults to None, which keeps all samples.
+        dtype (str, optional): Floating point type of the stored samples, e.g. "float32" to halve the file size.
+                               GPS time columns keep their type. Defaults to None, which keeps the type of all
+                               columns.
+
+    Returns:
+        str: Path of the posterior file.
+    """
+    if num_samples is not None and len(posterior) > num_samples:
+        posterior = posterior.iloc[np.linspace(0, len(posterior) - 1, num_samples).astype(int)]
+
+    numeric = posterior.select_dtypes(include=[np.number])
+    columns = {name: numeric[name].to_numpy() for name in numeric.columns}
+    if dtype is not None:
+        columns = {
+            name: values.astype(dtype) if values.dtype.kind == "f" and not name.endswith(TIME_COLUMN_SUFFIX) else values
+            for name, values in columns.items()
+        }
+    columns[EVENT_ID] = np.full(len(numeric), event_id)
+
+    path = posterior_path(result_directory, event_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_table(path, [columns])
+    return path
+
+def load_posterior(result_directory, event_id, columns=None):
+    """
+    Load the thinned posterior of an event.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+        event_id (int): Index of the event in the population.
+        columns (list, optional): Names of the columns to read. Defaults to all columns.
+
+    Returns:
+        pandas.DataFrame or None: The posterior samples, or None if no posterior was saved for the event.
+    """
+    path = posterior_path(result_directory, event_id)
+    if not os.path.exists(path):
+        return None
+    return read_table(path, columns=columns)
+
+def load_posteriors(result_directory, event_ids=None, columns=None):
+    """
+    Load the thinned posteriors of several events into a single table.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+        event_ids (list, optional): Events to load. Defaults to all events with a saved posterior.
+        columns (list, optional): Names of the columns to read. Defaults to all columns.
+
+    Returns:
+        pandas.DataFrame: The posterior samples of all events, with the event id of each sample in the column
+                          EVENT_ID.
+    """
+    import pandas as pd
+
+    if event_ids is None:
+        directory = os.path.join(result_directory, POSTERIOR_DIRECTORY)
+        file_names = os.listdir(directory) if os.path.isdir(directory) else []
+        event_ids = sorted(int(name[len("event_"):-len(".arrow")]) for name in file_names if name.endswith(".arrow"))
+
+    if columns is not None and EVENT_ID not in columns:
+        columns = list(columns) + [EVENT_ID]
+
+    posteriors = [load_posterior(result_directory, event_id, columns=columns) for event_id in event_ids]
+    posteriors = [posterior for posterior in posteriors if posterior is not None]
+    if not posteriors:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(posteriors, ignore_index=True)
+
+def summary_path(result_directory, event_id):
+    """
+    Build the path of the summary file of an event.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+        event_id (int): Index of the event in the population.
+
+    Returns:
+        str: Path of the summary file.
+    """
+    return os.path.join(result_directory, SUMMARY_DIRECTORY, f"event_{event_id}.json")
+
+def save_event_summary(result_directory, event_id, summary):
+    """
+    Save the summary of the result of an event.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+        event_id (int): Index of the event in the population.
+        summary (dict): Flat mapping from statistic name to a number, e.g. as returned by
+                        parameter_estimation.summarize_result.
+
+    Returns:
+        str: Path of the summary file.
+    """
+    path = summary_path(result_directory, event_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({EVENT_ID: event_id, **summary}, f, indent=4)
+    return path
+
+def load_event_summary(result_directory, event_id):
+    """
+    Load the summary of the result of an event.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+        event_id (int): Index of the event in the population.
+
+    Returns:
+        dict or None: The summary saved by save_event_summary, or None if the event has no summary.
+    """
+    path = summary_path(result_directory, event_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def load_event_summaries(result_directory):
+    """
+    Load the summaries of all events of a run into a table.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+
+    Returns:
+        pandas.DataFrame: One row per event with a summary, indexed by event id.
+    """
+    import pandas as pd
+
+    rows = []
+    for path in glob.glob(os.path.join(result_directory, SUMMARY_DIRECTORY, "event_*.json")):
+        with open(path, 'r') as f:
+            rows.append(json.load(f))
+    return pd.DataFrame(rows if rows else {EVENT_ID: []}).set_index(EVENT_ID).sort_index()
+
+def _retain(path, mode):
+    # Apply a retention mode to a single file
+    if mode == "drop":
+        os.remove(path)
+    elif mode == "compress":
+        with open(path, 'rb') as source, gzip.open(f"{path}.gz", 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.remove(path)
+    elif mode != "keep":
+        raise ValueError(f"Unknown retention mode {mode}; choose one of {', '.join(RETENTION_MODES)}.")
+
+def apply_retention_policy(result_directory, label, full_results="drop", sampler_internals="drop"):
+    """
+    Keep, compress or delete the files the sampler wrote for an event.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+        label (str): Label of the event, the prefix of its sampler files.
+        full_results (str): One of RETENTION_MODES for the full result file "<label>_result.json". A compressed
+                            result can still be read with bilby.result.read_in_result. Defaults to "drop".
+        sampler_internals (str): One of RETENTION_MODES for the remaining files of the sampler, i.e. its checkpoint
+                                 and resume files and checkpoint plots. Defaults to "drop".
+
+    Returns:
+        None.
+
+    Apply it only after the thinned posterior and the summary of the event have been saved, as the dropped files
+    cannot be recovered.
+    """
+    result_file = os.path.join(result_directory, f"{label}_result.json")
+    for path in glob.glob(os.path.join(result_directory, f"{label}_*")):
+        if path.endswith(".gz"):
+            continue
+        _retain(path, full_results if path == result_file else sampler_internals)
+
+def bias_table_path(result_directory, config):
+    """
+    Build the path of the columnar bias table.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+        config (dict): Configuration dictionary with the key "bias_output_file".
+
+    Returns:
+        str: Path of the bias table, "bias_output_file" with the extension ".arrow".
+    """
+    return f"{result_directory}/{os.path.splitext(config['bias_output_file'])[0]}.arrow"
+
+def save_biases(result_directory, config, bias_df):
+    """
+    Save the bias table both as CSV and as a columnar Arrow file.
+
+    Args:
+        result_directory (str): Directory where the results are stored.
+        config (dict): Configuration dictionary with the key "bias_output_file".
+        bias_df (pandas.DataFrame): One row of biases per event, indexed by event id.
+
+    Returns:
+        str: Path of the CSV file.
+    """
+    csv_path = f"{result_directory}/{config['bias_output_file']}"
+    bias_df.to_csv(csv_path, index=True)
+
+    table = bias_df.rename_axis(EVENT_ID).reset_index()
+    write_table(bias_table_path(result_directory, config), [{name: table[name].to_numpy() for name in table.columns}])
+    return csv_path
+
+def load_biases(path):
+    """
+    Load a bias table saved by save_biases.
+
+    Args:
+        path (str): Path of the bias table, either the CSV or the Arrow file.
+
+    Returns:
+        pandas.DataFrame: One row of biases per event, indexed by event id.
+    """
+    import pandas as pd
+
+    if path.endswith(".arrow"):
+        return read_table(path).set_index(EVENT_ID)
+    return pd.read_csv(path, index_col=0).rename_axis(EVENT_ID)
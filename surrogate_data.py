@@ -0,0 +1,214 @@
+import os  # Import os to handle file paths and the LAL_DATA_PATH environment variable
+import urllib.error  # Import urllib.error to report failed downloads
+import urllib.request  # Import urllib.request to download the surrogate data files
+from layout import comparison_approximants  # Import the estimation approximants of an approximant comparison
+
+# bilby (and through it LAL) is imported inside preload_surrogates and h5py inside the check of the data files, so that
+# runs without surrogates do not pay for importing them.
+
+# Data files which LALSimulation reads from $LAL_DATA_PATH for the surrogate approximants, keyed by approximant
+SURROGATE_DATA_FILES = {
+    "NRSur7dq2": "NRSur7dq2.h5",
+    "NRSur7dq4": "NRSur7dq4_v1.0.h5",
+    "NRHybSur3dq8": "NRHybSur3dq8_lal_v1.0.h5",
+}
+
+# Directory and base URL of the data files used if the configuration does not set them. The URL is the Zenodo record
+# of lalsuite-waveform-data, which holds the data files for LALSuite 7.25 and later.
+DEFAULT_SURROGATE_DATA_DIRECTORY = "~/lal_data"
+DEFAULT_SURROGATE_DATA_URL = "https://zenodo.org/records/14999310/files"
+
+# Source parameters of the waveform generated to load a surrogate; an equal mass binary heavy enough for the
+# surrogates to cover the frequency band of the pipeline
+_PRELOAD_PARAMETERS = dict(
+    mass_1=150.0, mass_2=150.0, luminosity_distance=1000.0, a_1=0.0, tilt_1=0.0, phi_12=0.0, a_2=0.0, tilt_2=0.0,
+    phi_jl=0.0, theta_jn=0.0, phase=0.0,
+)
+
+# Surrogate approximants whose data has been loaded by this process. Worker processes forked after a surrogate has
+# been loaded inherit both the loaded data and this set.
+_loaded_surrogates = set()
+
+def required_surrogates(config):
+    """
+    List the surrogate approximants used by a run.
+
+    Args:
+        config (dict): Configuration dictionary with the injection and estimation approximants and the optional
+                       "comparison_approximants".
+
+    Returns:
+        list: The approximants of SURROGATE_DATA_FILES used for injection or estimation, in sorted order.
+    """
+    approximants = {config["waveform_approximant_injection"], config["waveform_approximant_estimation"]}
+    approximants.update(comparison_approximants(config))
+    return sorted(approximant for approximant in approximants if approximant in SURROGATE_DATA_FILES)
+
+def surrogate_data_directory(config):
+    """
+    Get the local directory of the surrogate data files.
+
+    Args:
+        config (dict): Configuration dictionary with the optional key "surrogate_data_directory".
+
+    Returns:
+        str: The directory with the user's home directory expanded, DEFAULT_SURROGATE_DATA_DIRECTORY if the
+             configuration does not set one.
+    """
+    return os.path.expanduser(config.get("surrogate_data_directory") or DEFAULT_SURROGATE_DATA_DIRECTORY)
+
+def surrogate_data_path(config, approximant):
+    """
+    Build the path of the data file of a surrogate approximant.
+
+    Args:
+        config (dict): Configuration dictionary with the optional key "surrogate_data_directory".
+        approximant (str): Surrogate approximant, one of SURROGATE_DATA_FILES.
+
+    Returns:
+        str: Path of the data file in the surrogate data directory.
+    """
+    return os.path.join(surrogate_data_directory(config), SURROGATE_DATA_FILES[approximant])
+
+def _find_surrogate_data(config, approximant):
+    # Look for the data file in the surrogate data directory, then in the directories of LAL_DATA_PATH
+    directories = [surrogate_data_directory(config)] + os.environ.get("LAL_DATA_PATH", "").split(os.pathsep)
+    for directory in filter(None, directories):
+        path = os.path.join(directory, SURROGATE_DATA_FILES[approximant])
+        if os.path.exists(path):
+            return path
+    return None
+
+def _is_readable_hdf5(path):
+    # LALSimulation crashes the whole process on a data file it cannot read, so truncated or mistaken downloads are
+    # recognized by opening the file with h5py first
+    import h5py  # Import h5py to open the HDF5 data files
+
+    try:
+        with h5py.File(path, 'r'):
+            return True
+    except OSError:
+        return False
+
+def download_surrogate_data(config, approximant):
+    """
+    Download the data file of a surrogate approximant into the surrogate data directory, unless it is present.
+
+    Args:
+        config (dict): Configuration dictionary with the optional keys "surrogate_data_directory" and
+                       "surrogate_data_url" (base URL the file name is appended to).
+        approximant (str): Surrogate approximant, one of SURROGATE_DATA_FILES.
+
+    Returns:
+        str: Path of the data file.
+
+    Raises:
+        RuntimeError: If the file cannot be downloaded, e.g. without network access, or is not a readable HDF5 file.
+    """
+    path = surrogate_data_path(config, approximant)
+    if os.path.exists(path):
+        return path
+
+    url = f"{(config.get('surrogate_data_url') or DEFAULT_SURROGATE_DATA_URL).rstrip('/')}/{os.path.basename(path)}"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    print(f"Downloading the {approximant} data from {url} to {path}...")
+
+    # Download to a temporary file first, so that an interrupted download or a concurrent job never leaves a
+    # truncated data file behind
+    temporary_path = f"{path}.{os.getpid()}.part"
+    try:
+        urllib.request.urlretrieve(url, temporary_path)
+        if not _is_readable_hdf5(temporary_path):
+            raise RuntimeError(f"The file downloaded from {url} is not a readable HDF5 file.")
+        os.replace(temporary_path, path)
+    except urllib.error.URLError as e:
+        raise RuntimeError(
+            f"Could not download the {approximant} data from {url} ({getattr(e, 'reason', e)}). Without network "
+            f"access, copy {os.path.basename(path)} into {os.path.dirname(path)} by hand."
+        ) from e
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+    return path
+
+def check_surrogate_data(config):
+    """
+    Check that the data files of the surrogate approximants of a run are present, and point LALSimulation to them.
+
+    Args:
+        config (dict): Configuration dictionary. Files which are neither in the surrogate data directory nor in a
+                       directory of LAL_DATA_PATH are downloaded first if the optional key "surrogate_data_download"
+                       is true (the default).
+
+    Returns:
+        list: Paths of the data files of the surrogates used by the run; empty if the run uses no surrogate.
+
+    Raises:
+        FileNotFoundError: If a data file is missing (and downloading it is disabled).
+        RuntimeError: If a data file cannot be downloaded or is not a readable HDF5 file.
+
+    Call it before the first waveform is generated, so that a missing file stops the run at once rather than making
+    every event fail in the reference frequency loop. The surrogate data directory is prepended to LAL_DATA_PATH of
+    the current process, from which worker processes inherit it.
+    """
+    paths = []
+    for approximant in required_surrogates(config):
+        path = _find_surrogate_data(config, approximant)
+        if path is None:
+            path = surrogate_data_path(config, approximant)
+            if not config.get("surrogate_data_download", True):
+                raise FileNotFoundError(
+                    f"The {approximant} data file {path} is missing. Run download_surrogate.py with network access, "
+                    f"or copy {os.path.basename(path)} into {os.path.dirname(path)}."
+                )
+            download_surrogate_data(config, approximant)
+        if not _is_readable_hdf5(path):
+            raise RuntimeError(f"The {approximant} data file {path} is not a readable HDF5 file; delete it and "
+                               f"download it again.")
+        paths.append(path)
+
+    if paths:
+        directory = surrogate_data_directory(config)
+        lal_data_path = os.environ.get("LAL_DATA_PATH", "")
+        if directory not in lal_data_path.split(os.pathsep):
+            os.environ["LAL_DATA_PATH"] = os.pathsep.join(filter(None, (directory, lal_data_path)))
+
+    return paths
+
+def preload_surrogates(config):
+    """
+    Load the data of the surrogate approximants of a run into the current process, once per process.
+
+    Args:
+        config (dict): Configuration dictionary of the run; check_surrogate_data must have been called with it.
+
+    Returns:
+        None.
+
+    LALSimulation reads the HDF5 file of a surrogate when it first generates one of its waveforms and keeps the data
+    for the lifetime of the process. Generating one waveform here moves this load out of the sampler. Use it as the
+    initializer of worker pools: workers started by forking a process which already loaded the data share its memory
+    pages read-only (copy-on-write) instead of reading the file again, and other workers load it once each. The data
+    is unpacked into LAL's own structures, so it cannot be memory-mapped from the file.
+    """
+    pending = [approximant for approximant in required_surrogates(config) if approximant not in _loaded_surrogates]
+    if not pending:
+        return
+
+    import bilby  # Import bilby for gravitational wave data analysis
+    import numpy as np  # Import numpy for numerical operations
+
+    frequency_array = np.arange(0, config["maximum_frequency"] + 1 / config["duration"], 1 / config["duration"])
+    for approximant in pending:
+        try:
+            bilby.gw.source.lal_binary_black_hole(
+                frequency_array, **_PRELOAD_PARAMETERS, waveform_approximant=approximant,
+                reference_frequency=config["reference_frequency"], minimum_frequency=config["minimum_frequency"],
+                maximum_frequency=config["maximum_frequency"],
+            )
+        except Exception as e:
+            # The presence of the data file has been checked, so the data is loaded with the first waveform instead
+            print(f"Warning: could not preload the {approximant} data: {e}")
+            continue
+        _loaded_surrogates.add(approximant)
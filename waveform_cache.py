@@ -0,0 +1,155 @@
+import hashlib  # Import hashlib to name the files of the on-disk cache
+import os  # Import os to handle file operations
+from collections import OrderedDict  # Import OrderedDict to keep the cached waveforms in least recently used order
+import numpy as np  # Import numpy for numerical operations
+import bilby  # Import bilby for gravitational wave data analysis
+
+# Settings of the cache of the current process; see configure_waveform_cache
+_settings = {"max_bytes": 512 * 1024 ** 2, "directory": None, "significant_digits": 12}
+
+# Cached polarizations keyed by the cache key, in least recently used order, and their total size in bytes
+_memory_cache = OrderedDict()
+_memory_bytes = 0
+
+# Number of lookups answered from memory, from disk and by generating the waveform
+_counters = {"hits": 0, "disk_hits": 0, "misses": 0}
+
+def configure_waveform_cache(max_megabytes=512, directory=None, significant_digits=12):
+    """
+    Configure the waveform cache of the current process.
+
+    Args:
+        max_megabytes (float): Memory the cached waveforms may use before the least recently used ones are evicted.
+                               Defaults to 512.
+        directory (str, optional): Directory of the on-disk tier. Defaults to None, which disables it.
+        significant_digits (int): Number of significant digits to which parameters are rounded in the cache key.
+                                  Defaults to 12.
+
+    Returns:
+        None.
+    """
+    _settings["max_bytes"] = int(max_megabytes * 1024 ** 2)
+    _settings["directory"] = directory
+    _settings["significant_digits"] = significant_digits
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+    _evict()
+
+def configure_waveform_cache_from_config(config):
+    """
+    Configure the waveform cache from the optional "waveform_cache" section of the configuration.
+
+    Args:
+        config (dict): Configuration dictionary. The "waveform_cache" section may contain the keys "max_megabytes",
+                       "directory" and "significant_digits" (see configure_waveform_cache).
+
+    Returns:
+        None.
+    """
+    configure_waveform_cache(**config.get("waveform_cache", {}))
+
+def cache_info():
+    """
+    Report the state of the waveform cache of the current process.
+
+    Returns:
+        dict: The number of "hits" (answered from memory), "disk_hits" (answered from disk) and "misses" (generated),
+              the number of waveforms held in memory ("entries") and their size in bytes ("bytes").
+    """
+    return {**_counters, "entries": len(_memory_cache), "bytes": _memory_bytes}
+
+def clear_waveform_cache():
+    """
+    Remove all waveforms cached in memory and reset the counters. The on-disk tier is left untouched.
+
+    Returns:
+        None.
+    """
+    global _memory_bytes
+    _memory_cache.clear()
+    _memory_bytes = 0
+    for name in _counters:
+        _counters[name] = 0
+
+def _round(value):
+    # Round numbers to the configured significant digits so that parameters which differ by floating point noise
+    # share a cache entry
+    if isinstance(value, (float, np.floating)):
+        return float(f"{value:.{_settings['significant_digits']}g}")
+    return value
+
+def _evict():
+    # Drop the least recently used waveforms until the cache fits into its memory budget
+    global _memory_bytes
+    while _memory_cache and _memory_bytes > _settings["max_bytes"]:
+        _, polarizations = _memory_cache.popitem(last=False)
+        _memory_bytes -= sum(array.nbytes for array in polarizations.values())
+
+def _store(key, polarizations):
+    global _memory_bytes
+    _memory_cache[key] = polarizations
+    _memory_bytes += sum(array.nbytes for array in polarizations.values())
+    _evict()
+
+def _disk_path(key):
+    return os.path.join(_settings["directory"], hashlib.sha256(repr(key).encode()).hexdigest() + ".npz")
+
+def cached_lal_binary_black_hole(frequency_array, mass_1, mass_2, luminosity_distance, a_1, tilt_1, phi_12, a_2,
+                                 tilt_2, phi_jl, theta_jn, phase, **kwargs):
+    """
+    Memoized drop-in replacement for bilby.gw.source.lal_binary_black_hole.
+
+    Args:
+        frequency_array (numpy.ndarray): Frequencies at which to evaluate the waveform.
+        mass_1, mass_2, luminosity_distance, a_1, tilt_1, phi_12, a_2, tilt_2, phi_jl, theta_jn, phase (float):
+            Source parameters, see bilby.gw.source.lal_binary_black_hole.
+        **kwargs: Waveform arguments such as the waveform approximant and the reference frequency.
+
+    Returns:
+        dict or None: Copies of the plus and cross polarizations, or None if the waveform could not be generated.
+
+    Waveforms are keyed by the waveform arguments, the source parameters rounded to the configured significant
+    digits and the frequency grid. They are looked up in a memory-bounded least recently used cache, then in the
+    optional on-disk tier, and only generated on a miss. Use it for waveforms which are evaluated repeatedly, such as
+    injections and visualization, not inside the likelihood where parameters never repeat.
+    """
+    parameters = dict(
+        mass_1=mass_1, mass_2=mass_2, luminosity_distance=luminosity_distance, a_1=a_1, tilt_1=tilt_1,
+        phi_12=phi_12, a_2=a_2, tilt_2=tilt_2, phi_jl=phi_jl, theta_jn=theta_jn, phase=phase,
+    )
+    frequency_grid = (len(frequency_array), _round(frequency_array[0]), _round(frequency_array[-1]))
+    key = (
+        frequency_grid,
+        tuple(sorted((name, _round(value)) for name, value in parameters.items())),
+        tuple(sorted((name, _round(value)) for name, value in kwargs.items())),
+    )
+
+    polarizations = _memory_cache.get(key)
+    if polarizations is not None:
+        _counters["hits"] += 1
+        _memory_cache.move_to_end(key)
+        return {mode: array.copy() for mode, array in polarizations.items()}
+
+    if _settings["directory"] is not None and os.path.exists(_disk_path(key)):
+        _counters["disk_hits"] += 1
+        with np.load(_disk_path(key)) as data:
+            polarizations = {mode: data[mode] for mode in data.files}
+        _store(key, polarizations)
+        return {mode: array.copy() for mode, array in polarizations.items()}
+
+    _counters["misses"] += 1
+    polarizations = bilby.gw.source.lal_binary_black_hole(frequency_array, **parameters, **kwargs)
+    if polarizations is None:
+        # Failed waveforms are not cached, so that errors are raised or reported again
+        return None
+
+    _store(key, {mode: np.array(array) for mode, array in polarizations.items()})
+    if _settings["directory"] is not None:
+        # Write to a temporary file first, so that concurrent processes never read a partially written file
+        path = _disk_path(key)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'wb') as f:
+            np.savez(f, **polarizations)
+        os.replace(temporary_path, path)
+
+    return polarizations
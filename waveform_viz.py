@@ -1,47 +1,162 @@
+import os  # Import os to handle file operations
 import bilby  # Import bilby for gravitational wave data analysis
-import json  # Import json to handle JSON file operations
-import matplotlib.pyplot as plt  # Import matplotlib for plotting
 import numpy as np  # Import numpy for numerical operations
-from main import load_config  # Import the configuration loader function
+from storage import load_population  # Import the population loader of the storage layer
+from bias_calculation import load_event_posterior  # Import the posterior loader of a single event
+from parameter_estimation import create_waveform_generator  # Import the waveform generator factory
+from waveform_cache import cache_info, cached_lal_binary_black_hole, configure_waveform_cache_from_config  # Import the waveform cache
 
-# Load configuration settings
-config = load_config()
+# matplotlib is imported inside plot_waveforms, so that computing the residuals of the events of a run does not pay for
+# importing it.
 
-def generate_waveform(model, ref_frequency, parameters):
+# Directory inside a results directory holding the residuals computed for each event as it finishes
+RESIDUAL_DIRECTORY = "residuals"
+
+# Waveform generators keyed by (approximant, reference frequency, duration, sampling frequency, frequency range)
+_generator_cache = {}
+
+# Interferometers used to project waveforms, keyed by (detectors, duration, sampling frequency, frequency range)
+_interferometer_cache = {}
+
+def get_waveform_generator(config, approximant, ref_frequency):
+    """
+    Get the waveform generator for a waveform model and reference frequency, creating it only on first use.
+
+    Args:
+        config (dict): Configuration dictionary containing the duration, sampling frequency and frequency range.
+        approximant (str): The waveform model to use (e.g., "IMRPhenomPv2").
+        ref_frequency (float): Reference frequency for waveform generation.
+
+    Returns:
+        bilby.gw.WaveformGenerator: The cached waveform generator.
+    """
+    key = (approximant, ref_frequency, config["duration"], config["sampling_frequency"],
+           config["minimum_frequency"], config["maximum_frequency"])
+    if key not in _generator_cache:
+        _generator_cache[key] = create_waveform_generator(
+            config, approximant, ref_frequency, source_model=cached_lal_binary_black_hole
+        )
+    return _generator_cache[key]
+
+def get_interferometers(config, detectors):
+    """
+    Get interferometers without noise used to project waveforms onto the detectors.
+
+    Args:
+        config (dict): Configuration dictionary containing the duration, sampling frequency, frequency range and
+                       geocentric time.
+        detectors (list): Names of the detectors (e.g., ["H1", "L1"]).
+
+    Returns:
+        bilby.gw.detector.InterferometerList: The cached interferometers, whose data starts 2 seconds before the
+                                              geocentric time like in the parameter estimation.
+    """
+    key = (tuple(detectors), config["duration"], config["sampling_frequency"],
+           config["minimum_frequency"], config["maximum_frequency"])
+    if key not in _interferometer_cache:
+        ifos = bilby.gw.detector.InterferometerList(list(detectors))
+        ifos.set_strain_data_from_zero_noise(
+            sampling_frequency=config["sampling_frequency"],
+            duration=config["duration"],
+            start_time=config["geocent_time"] - 2,
+        )
+        for ifo in ifos:
+            ifo.minimum_frequency = config["minimum_frequency"]
+            ifo.maximum_frequency = config["maximum_frequency"]
+        _interferometer_cache[key] = ifos
+    return _interferometer_cache[key]
+
+def compute_waveforms(config, model, ref_frequency, parameter_sets, detectors=None):
     """
-    Generate time-domain waveform using the specified model and parameters.
+    Generate the waveforms of many parameter sets with a single waveform generator.
 
     Args:
+        config (dict): Configuration dictionary containing the duration, sampling frequency, frequency range,
+                       geocentric time and detector setup.
         model (str): The waveform model to use (e.g., "IMRPhenomPv2").
         ref_frequency (float): Reference frequency for waveform generation.
-        parameters (dict): Dictionary of parameters for generating the waveform.
+        parameter_sets (list): Dictionaries of parameters, one per waveform. Parameter sets without "geocent_time"
+                               use the geocentric time of the configuration.
+        detectors (list, optional): Detectors to project the waveforms onto. Defaults to the "detector_setup" of the
+                                    configuration.
 
     Returns:
-        tuple: A tuple containing the plus-polarization time-domain waveform and the time array.
-    """
-    # Define waveform arguments using the provided model and reference frequency
-    waveform_arguments = dict(
-        waveform_approximant=model,
-        reference_frequency=ref_frequency,
-        minimum_frequency=config['minimum_frequency'],
-        maximum_frequency=config["maximum_frequency"],
-    )
-    print(waveform_arguments)  # Print arguments for debugging
-
-    # Create a waveform generator using bilby
-    waveform_generator = bilby.gw.WaveformGenerator(
-        duration=config["duration"],
-        sampling_frequency=config["sampling_frequency"],
-        frequency_domain_source_model=bilby.gw.source.lal_binary_black_hole,
-        parameter_conversion=bilby.gw.conversion.convert_to_lal_binary_black_hole_parameters,
-        waveform_arguments=waveform_arguments
-    )
+        dict: Arrays with one row per parameter set:
+              - "time" and "frequency": the time and frequency arrays shared by all waveforms.
+              - "plus" and "cross": the time-domain polarizations.
+              - "plus_frequency_domain" and "cross_frequency_domain": the frequency-domain polarizations.
+              - "detectors": mapping from detector name to the frequency-domain strain projected onto the detector.
+    """
+    waveform_generator = get_waveform_generator(config, model, ref_frequency)
+    ifos = get_interferometers(config, detectors or config["detector_setup"])
+
+    num_waveforms = len(parameter_sets)
+    num_frequencies = len(waveform_generator.frequency_array)
+    plus = np.zeros((num_waveforms, num_frequencies), dtype=complex)
+    cross = np.zeros((num_waveforms, num_frequencies), dtype=complex)
+    projected = {ifo.name: np.zeros((num_waveforms, num_frequencies), dtype=complex) for ifo in ifos}
+
+    for j, parameters in enumerate(parameter_sets):
+        parameters = {"geocent_time": config["geocent_time"], **parameters}
+        polarizations = waveform_generator.frequency_domain_strain(parameters)
+        plus[j] = polarizations["plus"]
+        cross[j] = polarizations["cross"]
+        for ifo in ifos:
+            projected[ifo.name][j] = ifo.get_detector_response(polarizations, parameters)
+
+    # Transform all waveforms to the time domain at once
+    sampling_frequency = config["sampling_frequency"]
+    return {
+        "time": waveform_generator.time_array,
+        "frequency": waveform_generator.frequency_array,
+        "plus": np.fft.irfft(plus, axis=-1) * sampling_frequency,
+        "cross": np.fft.irfft(cross, axis=-1) * sampling_frequency,
+        "plus_frequency_domain": plus,
+        "cross_frequency_domain": cross,
+        "detectors": projected,
+    }
+
+def compute_overlaps(config, waveforms, reference_waveforms, detectors=None):
+    """
+    Compute the noise-weighted overlap and mismatch between two sets of detector-projected waveforms.
+
+    Args:
+        config (dict): Configuration dictionary containing the duration, sampling frequency, frequency range and
+                       detector setup.
+        waveforms (dict): Waveforms as returned by compute_waveforms.
+        reference_waveforms (dict): Waveforms to compare to, with the same number of rows as waveforms.
+        detectors (list, optional): Detectors to use. Defaults to the "detector_setup" of the configuration.
+
+    Returns:
+        dict: Arrays with one entry per pair of waveforms: the "overlap" and "mismatch" (1 - overlap) of the network
+              of detectors, and per detector the overlap under "overlap_<detector>".
 
-    # Generate the time-domain strain waveform
-    waveform = waveform_generator.time_domain_strain(parameters)
-    
-    # Return the plus polarization waveform and the corresponding time array
-    return waveform['plus'], waveform_generator.time_array
+    The overlap is the normalized real noise-weighted inner product <a|b> / sqrt(<a|a><b|b>) within the frequency
+    band of the detectors, computed for all pairs at once.
+    """
+    ifos = get_interferometers(config, detectors or config["detector_setup"])
+    duration = config["duration"]
+    overlaps = {}
+    network = np.zeros((3, len(next(iter(waveforms["detectors"].values())))))
+
+    for ifo in ifos:
+        mask = ifo.frequency_mask
+        psd = ifo.power_spectral_density_array[mask]
+        a = waveforms["detectors"][ifo.name][:, mask]
+        b = reference_waveforms["detectors"][ifo.name][:, mask]
+
+        # Noise-weighted inner products <a|b>, <a|a> and <b|b> of every pair
+        products = 4 / duration * np.real(np.stack([
+            np.sum(np.conj(a) * b / psd, axis=-1),
+            np.sum(np.abs(a) ** 2 / psd, axis=-1),
+            np.sum(np.abs(b) ** 2 / psd, axis=-1),
+        ]))
+        overlaps[f"overlap_{ifo.name}"] = products[0] / np.sqrt(products[1] * products[2])
+        network += products
+
+    overlaps["overlap"] = network[0] / np.sqrt(network[1] * network[2])
+    overlaps["mismatch"] = 1 - overlaps["overlap"]
+    return overlaps
 
 def plot_waveforms(time, waveforms, labels, filename):
     """
@@ -56,6 +171,8 @@ def plot_waveforms(time, waveforms, labels, filename):
     Returns:
         None. Displays the plot.
     """
+    import matplotlib.pyplot as plt  # Import matplotlib for plotting
+
     plt.figure(figsize=(10, 6))  # Create a new figure for plotting
     # Plot each waveform with its corresponding label
     for waveform, label in zip(waveforms, labels):
@@ -69,54 +186,131 @@ def plot_waveforms(time, waveforms, labels, filename):
     # plt.savefig(filename)
     plt.show()  # Display the plot
 
-def main(result_path, injection_model, evaluation_model, ref_frequency):
+def compute_residuals(config, result_path, injection_model, evaluation_model, ref_frequency, population=None):
     """
-    Main function to generate and compare waveforms for injected and estimated parameters.
+    Compare the waveforms of the injected and estimated parameters of all events with a result.
 
     Args:
+        config (dict): Configuration dictionary of the run.
         result_path (str): Path to the directory containing the population and results files.
         injection_model (str): Waveform model used for the injected signal.
         evaluation_model (str): Waveform model used for evaluating the signal.
         ref_frequency (float): Reference frequency for waveform generation.
+        population (dict, optional): Injection parameters of the events to compare, keyed by event id. Defaults to
+                                     the whole population saved in result_path.
+
+    Returns:
+        dict: Arrays with one row per event: the "event_id", the "time" array, the plus-polarization residuals
+              "residual_injection" (injection model minus evaluation model, both at the injected parameters) and
+              "residual_estimated" (injection model at the injected parameters minus evaluation model at the maximum
+              likelihood parameters), and the overlaps and mismatches of compute_overlaps for both comparisons
+              (suffixed with "_injection" and "_estimated").
+    """
+    configure_waveform_cache_from_config(config)
+
+    # Load the population parameters from the population file
+    if population is None:
+        population = dict(enumerate(load_population(result_path, config)))
+
+    # Use the maximum likelihood sample of the posterior of each event as its estimated parameters
+    event_ids, injection_params, estimated_params = [], [], []
+    for i, params in population.items():
+        posterior = load_event_posterior(result_path, i)
+        if posterior is None:
+            continue
+        event_ids.append(i)
+        injection_params.append(params)
+        estimated_params.append(posterior.loc[posterior["log_likelihood"].idxmax()].to_dict())
+
+    # Generate all waveforms of each model in one batch
+    injection = compute_waveforms(config, injection_model, ref_frequency, injection_params)
+    evaluation = compute_waveforms(config, evaluation_model, ref_frequency, injection_params + estimated_params)
+    num_events = len(event_ids)
+    evaluation_injection = {
+        "plus": evaluation["plus"][:num_events],
+        "detectors": {name: strain[:num_events] for name, strain in evaluation["detectors"].items()},
+    }
+    evaluation_estimated = {
+        "plus": evaluation["plus"][num_events:],
+        "detectors": {name: strain[num_events:] for name, strain in evaluation["detectors"].items()},
+    }
+
+    residuals = {
+        "event_id": np.array(event_ids),
+        "time": injection["time"],
+        "residual_injection": injection["plus"] - evaluation_injection["plus"],
+        "residual_estimated": injection["plus"] - evaluation_estimated["plus"],
+    }
+    for suffix, compared in (("injection", evaluation_injection), ("estimated", evaluation_estimated)):
+        for name, values in compute_overlaps(config, compared, injection).items():
+            residuals[f"{name}_{suffix}"] = values
+
+    return residuals
+
+def record_event_residuals(config, result_directory, event_id, params, ref_frequency):
+    """
+    Compute the residuals of a single event with a posterior and save them to the residuals directory.
+
+    Args:
+        config (dict): Configuration dictionary of the run; the injection and estimation approximants are compared.
+        result_directory (str): Directory where the results are stored.
+        event_id (int): Index of the event in the population.
+        params (dict): Injection parameters of the event.
+        ref_frequency (float): Reference frequency used for the parameter estimation of the event.
 
     Returns:
-        None. Generates and plots the waveforms.
+        str: Path of the residuals/event_<i>.npz file holding the arrays of compute_residuals.
     """
-    # Load the population parameters from a JSON file
-    with open(f'{result_path}/population.json', 'r') as f:
-        population = json.load(f)
-    
-    # Load Bilby results from a JSON file
-    result = bilby.core.result.read_in_result(filename=f"{result_path}/label_result.json")
+    residuals = compute_residuals(
+        config, result_directory, config["waveform_approximant_injection"], config["waveform_approximant_estimation"],
+        ref_frequency, population={event_id: params},
+    )
 
-    # Iterate over each set of injection parameters in the population
-    for i, injection_params in enumerate(population):
-        # Generate waveform using the injection model and parameters
-        injection_waveform = generate_waveform(injection_model, ref_frequency, injection_params)
+    path = os.path.join(result_directory, RESIDUAL_DIRECTORY, f"event_{event_id}.npz")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez(path, **residuals)
+    return path
 
-        # Generate waveform using the evaluation model and injection parameters
-        evaluation_waveform_injection_params = generate_waveform(evaluation_model, ref_frequency, injection_params)
+def main(config, result_path, injection_model, evaluation_model, ref_frequency, plot=True):
+    """
+    Main function to generate and compare waveforms for injected and estimated parameters.
 
-        # Extract estimated parameters from the Bilby result
-        estimated_params = result.posterior.iloc[i].to_dict()  # Ensure correct indexing and mapping
+    Args:
+        config (dict): Configuration dictionary of the run.
+        result_path (str): Path to the directory containing the population and results files.
+        injection_model (str): Waveform model used for the injected signal.
+        evaluation_model (str): Waveform model used for evaluating the signal.
+        ref_frequency (float): Reference frequency for waveform generation.
+        plot (bool): Whether to plot the residuals of each event. Defaults to True.
 
-        # Generate waveform using the evaluation model and estimated parameters
-        evaluation_waveform_estimated_params = generate_waveform(evaluation_model, ref_frequency, estimated_params)
+    Returns:
+        dict: The residuals and mismatches returned by compute_residuals.
+    """
+    residuals = compute_residuals(config, result_path, injection_model, evaluation_model, ref_frequency)
 
-        # Calculate residuals between injection and evaluation waveforms
-        resid_both_injection = injection_waveform[0] - evaluation_waveform_injection_params[0]
-        resid_injection_evaluation = injection_waveform[0] - evaluation_waveform_estimated_params[0]
+    for j, i in enumerate(residuals["event_id"]):
+        print(f"Event {i}: mismatch eval(injection) {residuals['mismatch_injection'][j]:.3g}, "
+              f"eval(estimated) {residuals['mismatch_estimated'][j]:.3g}")
 
         # Plot the waveforms and residuals
-        plot_filename = f'waveform_overlay_{i}.png'
-        plot_waveforms(
-            injection_waveform[1],  # Time array for x-axis
-            [resid_both_injection, resid_injection_evaluation],  # List of residual waveforms
-            ['Residual eval(injection)', 'Residual eval(estimated)'],  # Labels for the waveforms
-            plot_filename  # Filename to save the plot
-        )
+        if plot:
+            plot_waveforms(
+                residuals["time"],  # Time array for x-axis
+                [residuals["residual_injection"][j], residuals["residual_estimated"][j]],  # Residual waveforms
+                ['Residual eval(injection)', 'Residual eval(estimated)'],  # Labels for the waveforms
+                f'waveform_overlay_{i}.png'  # Filename to save the plot
+            )
+
+    info = cache_info()
+    print(f"Waveform cache: {info['hits']} hits, {info['disk_hits']} disk hits, {info['misses']} misses")
+    return residuals
 
 if __name__ == '__main__':
+    from main import load_config  # Import the configuration loader function
+
+    # Load configuration settings
+    config = load_config()
+
     # Define the result path and models to use based on the configuration
     result_path = "results"
     injection_model = config["waveform_approximant_injection"]
@@ -124,4 +318,4 @@ if __name__ == '__main__':
     ref_frequency = config["reference_frequency"]
 
     # Run the main function
-    main(result_path=result_path, injection_model=injection_model, evaluation_model=evaluation_model, ref_frequency=ref_frequency)
+    main(config=config, result_path=result_path, injection_model=injection_model, evaluation_model=evaluation_model, ref_frequency=ref_frequency)